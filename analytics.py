@@ -3,22 +3,36 @@ from scipy.stats import linregress
 
 
 class PhysicsAnalyzer:
+    @staticmethod
+    def calculate_msd(sim):
+        """
+        Средний квадрат смещения по ансамблю в контрольных точках.
+        Если история хранится только для трассеров, берется MSD всех
+        частиц, посчитанный движком на лету (sim.msd).
+        Возвращает: steps, mean_r2.
+        """
+        msd = getattr(sim, "msd", None)
+        if msd is not None:
+            mean_r2 = np.asarray(msd)
+        else:
+            X = np.array(sim.history_x)
+            Y = np.array(sim.history_y)
+
+            # Квадрат смещения от начальной точки для каждой частицы
+            R2 = (X - X[0]) ** 2 + (Y - Y[0]) ** 2
+            mean_r2 = np.mean(R2, axis=1)
+
+        steps = np.arange(len(mean_r2)) * sim.history_step
+        return steps, mean_r2
+
     @staticmethod
     def calculate_diffusion_coefficient(sim):
         """
         Вычисляет коэффициент диффузии D_eff как наклон графика MSD (<r^2>).
         Возвращает: slope (наклон), r2_score (коэффициент детерминации).
         """
-        X = np.array(sim.history_x)
-        Y = np.array(sim.history_y)
-
-        # Квадрат смещения от начальной точки для каждой частицы
-        R2 = (X - X[0]) ** 2 + (Y - Y[0]) ** 2
-
         # Средний квадрат смещения (MSD) по ансамблю
-        mean_r2 = np.mean(R2, axis=1)
-
-        steps = np.arange(len(mean_r2)) * sim.history_step
+        steps, mean_r2 = PhysicsAnalyzer.calculate_msd(sim)
 
         # Отбрасываем первую половину симуляции (переходный процесс)
         start_idx = len(steps) // 2
@@ -30,6 +44,27 @@ class PhysicsAnalyzer:
 
         return slope, r_value**2
 
+    @staticmethod
+    def calculate_particle_slopes(sim):
+        """
+        Вклад каждой частицы в наклон MSD: МНК-наклон r_i^2(t) на том же
+        окне, что и в calculate_diffusion_coefficient.
+        Среднее по частицам совпадает с наклоном усредненного MSD,
+        поэтому разброс массива дает статистическую ошибку D_eff.
+        При трассерах (sim.tracers) — только по частицам с историей.
+        """
+        X = np.array(sim.history_x)
+        Y = np.array(sim.history_y)
+        R2 = (X - X[0]) ** 2 + (Y - Y[0]) ** 2
+
+        steps = np.arange(R2.shape[0]) * sim.history_step
+        start_idx = len(steps) // 2
+
+        t = steps[start_idx:] - np.mean(steps[start_idx:])
+        r2 = R2[start_idx:] - np.mean(R2[start_idx:], axis=0)
+
+        return t @ r2 / np.sum(t**2)
+
     @staticmethod
     def calculate_radial_concentration(sim, dr=5.0):
         """
@@ -62,3 +97,165 @@ class PhysicsAnalyzer:
         density = counts / areas
 
         return centers, counts, density
+
+    @staticmethod
+    def calculate_survival_curve(fpt, target):
+        """
+        Кривая выживания S(t) — доля частиц, еще не достигших цели к шагу t.
+        fpt: FirstPassageRecorder после прогона; target: имя цели.
+        """
+        times = fpt.times[target]
+        steps = np.arange(fpt.num_steps + 1)
+
+        reached = np.sort(times[times >= 0])
+        survival = 1.0 - np.searchsorted(reached, steps, side="right") / len(times)
+
+        return steps, survival
+
+    @staticmethod
+    def calculate_mean_first_passage(fpt, target):
+        """
+        Среднее время первого достижения цели.
+        Возвращает: mfpt (по достигшим), reached_fraction (доля достигших),
+        restricted_mfpt (площадь под S(t) до конца прогона — учитывает
+        не достигших как цензурированные).
+        """
+        times = fpt.times[target]
+        reached = times[times >= 0]
+        mfpt = np.mean(reached) if len(reached) else np.nan
+
+        _, survival = PhysicsAnalyzer.calculate_survival_curve(fpt, target)
+        restricted_mfpt = np.sum(survival[:-1])
+
+        return mfpt, len(reached) / len(times), restricted_mfpt
+
+    @staticmethod
+    def calculate_density_field(field):
+        """
+        Карта концентрации из DensityField: среднее число частиц в ячейке
+        по накопленным снимкам, деленное на площадь ячейки.
+        Возвращает: x_centers, y_centers, density (ny, nx).
+        """
+        x_edges, y_edges = field.edges
+        x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+        y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+
+        snapshots = max(field.num_snapshots, 1)
+        density = field.counts / (snapshots * field.cell_area)
+
+        return x_centers, y_centers, density
+
+    @staticmethod
+    def calculate_concentration_profile(cell, width=None):
+        """
+        Профиль концентрации из PermeationCell, усредненный по контрольным
+        точкам стационарного окна. width — ширина ячейки поперек профиля
+        (по умолчанию ширина wrap_x; без wrap_x обязательна).
+        Возвращает: centers, concentration.
+        """
+        if width is None:
+            if cell.wrap_x is None:
+                raise ValueError("width is required for a cell without wrap_x")
+            width = cell.wrap_x[1]
+        edges = cell.profile_edges
+        centers = (edges[:-1] + edges[1:]) / 2
+        snapshots = max(cell.profile_snapshots, 1)
+        concentration = cell.profile_counts / (snapshots * np.diff(edges) * width)
+        return centers, concentration
+
+    @staticmethod
+    def calculate_permeation(cell, sink, width=None, trim=0.1):
+        """
+        Стационарный поток через сток и эффективная проницаемость.
+        J — среднее число поглощенных за шаг на единицу ширины (шаги
+        >= steady_from); градиент dC/dx — наклон прямой по профилю без
+        доли trim бинов у каждого края. D_eff = J / |dC/dx| (закон Фика),
+        permeability = J / ΔC, где ΔC — перепад прямой на длине профиля.
+        Возвращает: flux, gradient, d_eff, permeability.
+        """
+        if width is None:
+            if cell.wrap_x is None:
+                raise ValueError("width is required for a cell without wrap_x")
+            width = cell.wrap_x[1]
+        flux = np.mean(cell.absorbed[sink][max(cell.steady_from, 1) :]) / width
+
+        centers, concentration = PhysicsAnalyzer.calculate_concentration_profile(
+            cell, width
+        )
+        cut = int(len(centers) * trim)
+        inner = slice(cut, len(centers) - cut)
+        gradient, _, _, _, _ = linregress(centers[inner], concentration[inner])
+
+        drop = abs(gradient) * (centers[-1] - centers[0] + np.diff(centers)[0])
+        d_eff = flux / abs(gradient) if gradient else np.nan
+        permeability = flux / drop if drop else np.nan
+
+        return flux, gradient, d_eff, permeability
+
+    @staticmethod
+    def calculate_non_gaussian(sim):
+        """
+        Негауссов параметр alpha_2(t) = <dr^4> / <dr^4>_G - 1 по потоковым
+        моментам движка. <dr^4>_G = 3a^2 + 3b^2 + 2ab + 4c^2 — значение для
+        гауссова смещения с теми же a = <dx^2>, b = <dy^2>, c = <dx dy>,
+        поэтому анизотропия сама по себе не дает alpha_2 != 0 (для
+        изотропного случая это обычное <dr^4> / (2 <dr^2>^2) - 1).
+        Возвращает: steps, alpha2.
+        """
+        moments = np.asarray(sim.moments, dtype=float)
+        n = np.maximum(moments[:, 0], 1)
+        a, b, c = moments[:, 1] / n, moments[:, 2] / n, moments[:, 3] / n
+        r4 = moments[:, 4] / n
+        gaussian = 3 * a**2 + 3 * b**2 + 2 * a * b + 4 * c**2
+        with np.errstate(invalid="ignore", divide="ignore"):
+            alpha2 = np.where(gaussian > 0, r4 / gaussian - 1, 0.0)
+        steps = np.arange(len(moments)) * sim.history_step
+        return steps, alpha2
+
+    @staticmethod
+    def calculate_diffusion_tensor(sim, alpha2_tol=0.1, d_bulk=0.25):
+        """
+        Тензор диффузии 2x2 по потоковым моментам (без истории траекторий).
+        D_ij — половина МНК-наклона <dx_i dx_j>(t) на второй половине
+        прогона; главные направления — собственные векторы D.
+        Подгонка отклоняется (diffusive=False), если |alpha_2| на окне
+        превышает alpha2_tol: распределение смещений еще не гауссово.
+        tortuosity — d_bulk / lambda_i по главным направлениям.
+        """
+        moments = np.asarray(sim.moments, dtype=float)
+        n = np.maximum(moments[:, 0], 1)
+        steps, alpha2 = PhysicsAnalyzer.calculate_non_gaussian(sim)
+        start_idx = len(steps) // 2
+        window = slice(start_idx, None)
+
+        components = {}
+        for name, column in (("xx", 1), ("yy", 2), ("xy", 3)):
+            slope, _, _, _, _ = linregress(
+                steps[window], (moments[:, column] / n)[window]
+            )
+            components[name] = slope / 2.0
+        tensor = np.array(
+            [
+                [components["xx"], components["xy"]],
+                [components["xy"], components["yy"]],
+            ]
+        )
+
+        # Собственные значения по убыванию, векторы — столбцы
+        eigenvalues, directions = np.linalg.eigh(tensor)
+        eigenvalues, directions = eigenvalues[::-1], directions[:, ::-1]
+        angle = np.degrees(np.arctan2(directions[1, 0], directions[0, 0])) % 180.0
+
+        alpha2_max = float(np.max(np.abs(alpha2[window])))
+        with np.errstate(divide="ignore"):
+            tortuosity = d_bulk / eigenvalues
+
+        return {
+            "tensor": tensor,
+            "eigenvalues": eigenvalues,
+            "directions": directions,
+            "angle": angle,
+            "tortuosity": tortuosity,
+            "alpha2_max": alpha2_max,
+            "diffusive": alpha2_max <= alpha2_tol,
+        }
@@ -0,0 +1,367 @@
+import io
+import json
+import zipfile
+
+import numpy as np
+
+import geometry
+from simulation import SnapshotObserver
+
+ARCHIVE_VERSION = 1
+
+
+def _encode_chunk(block, precision):
+    """
+    Дельта-кодирование блока (время x частицы): координаты квантуются
+    с шагом precision, первая строка хранится целиком, остальные —
+    как приращения. Тип сужается до минимального целого.
+    """
+    q = np.round(block / precision).astype(np.int64)
+    delta = np.empty_like(q)
+    delta[0] = q[0]
+    delta[1:] = np.diff(q, axis=0)
+
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if delta.min() >= info.min and delta.max() <= info.max:
+            delta = delta.astype(dtype)
+            break
+
+    buf = io.BytesIO()
+    np.save(buf, delta)
+    return buf.getvalue()
+
+
+def _decode_chunk(data, precision):
+    delta = np.load(io.BytesIO(data))
+    return np.cumsum(delta, axis=0, dtype=np.int64) * precision
+
+
+def _array_bytes(array):
+    buf = io.BytesIO()
+    np.save(buf, array)
+    return buf.getvalue()
+
+
+def _json_default(value):
+    """Параметры запуска могут содержать массивы и функции (step_pdf)."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return repr(value)
+
+
+def _geometry_state(geo):
+    """
+    Параметры геометрии для восстановления без пересоздания (вкл. случайные
+    центры). Приватные атрибуты (кэши) не сохраняются.
+    """
+    params = {
+        key: value.tolist() if isinstance(value, np.ndarray) else value
+        for key, value in vars(geo).items()
+        if not key.startswith("_")
+    }
+    return {"class": type(geo).__name__, "params": params}
+
+
+def _restore_geometry(state):
+    cls = getattr(geometry, state["class"])
+    geo = cls.__new__(cls)
+    for key, value in state["params"].items():
+        setattr(geo, key, np.array(value) if isinstance(value, list) else value)
+    return geo
+
+
+class TrajectoryArchiveWriter(SnapshotObserver):
+    """
+    Потоковая запись траекторий в zip-архив во время SimulationEngine.run.
+
+    Снимки буферизуются до заполнения временного чанка (chunk_snapshots),
+    затем чанк режется по частицам (chunk_particles) и каждый кусок пишется
+    отдельным сжатым членом архива. В памяти держится не более одного
+    временного чанка. Координаты хранятся с точностью precision.
+
+    При трассерах (sim.tracers) пишутся только они, как в save_history;
+    MSD всего ансамбля сохраняется в метаданных.
+
+    Использование:
+        sim.add_observer(TrajectoryArchiveWriter("run.traj"))
+    """
+
+    def __init__(self, path, chunk_snapshots=16, chunk_particles=8192, precision=1e-4):
+        self.path = path
+        self.chunk_snapshots = chunk_snapshots
+        self.chunk_particles = chunk_particles
+        self.precision = precision
+
+        self.metadata = {}
+        self.num_particles = None
+        self.num_snapshots = 0
+        self._zip = None
+        self._buf_x = []
+        self._buf_y = []
+        self._idx = None
+
+    # --- SnapshotObserver ---
+    def on_start(self, sim):
+        self._idx = sim.tracer_indices()
+        self.open(
+            sim.num_trajectories if self._idx is None else len(self._idx),
+            sim.history_step,
+            config=sim.config,
+            geometry_state=_geometry_state(sim.geo_strategy),
+        )
+
+    def on_snapshot(self, sim, step):
+        if self._idx is None:
+            self.append(sim.x, sim.y)
+        else:
+            self.append(sim.x[self._idx], sim.y[self._idx])
+
+    def on_finish(self, sim):
+        if sim.msd is not None:
+            self.metadata["msd"] = sim.msd
+            self.metadata["moments"] = sim.moments
+        if self._idx is None:
+            self.close(final_x=sim.x, final_y=sim.y)
+        else:
+            self.close(final_x=sim.x[self._idx], final_y=sim.y[self._idx])
+
+    def on_abort(self, sim):
+        # Архив прерванного расчета читается до последней контрольной точки
+        if self._zip is None:
+            return
+        self._flush()
+        if sim.msd is not None:
+            self.metadata["msd"] = sim.msd[: self.num_snapshots]
+            self.metadata["moments"] = sim.moments[: self.num_snapshots]
+        self.metadata["complete"] = False
+        self.close()
+
+    # --- Прямой интерфейс ---
+    def open(self, num_particles, history_step, config=None, geometry_state=None):
+        self.num_particles = num_particles
+        self.metadata = {
+            "version": ARCHIVE_VERSION,
+            "num_particles": num_particles,
+            "history_step": history_step,
+            "chunk_snapshots": self.chunk_snapshots,
+            "chunk_particles": self.chunk_particles,
+            "precision": self.precision,
+            "config": config or {},
+            "geometry": geometry_state,
+        }
+        self._zip = zipfile.ZipFile(self.path, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def append(self, x, y):
+        if self._zip is None:
+            raise RuntimeError("Archive is not open")
+        self._buf_x.append(np.array(x, dtype=float))
+        self._buf_y.append(np.array(y, dtype=float))
+        if len(self._buf_x) == self.chunk_snapshots:
+            self._flush()
+
+    def _flush(self):
+        if not self._buf_x:
+            return
+        t_chunk = self.num_snapshots // self.chunk_snapshots
+        block_x = np.stack(self._buf_x)
+        block_y = np.stack(self._buf_y)
+
+        for p_chunk, start in enumerate(
+            range(0, self.num_particles, self.chunk_particles)
+        ):
+            part = slice(start, start + self.chunk_particles)
+            name = f"t{t_chunk:06d}_p{p_chunk:06d}.npy"
+            self._zip.writestr(
+                f"x/{name}", _encode_chunk(block_x[:, part], self.precision)
+            )
+            self._zip.writestr(
+                f"y/{name}", _encode_chunk(block_y[:, part], self.precision)
+            )
+
+        self.num_snapshots += len(self._buf_x)
+        self._buf_x = []
+        self._buf_y = []
+
+    def close(self, final_x=None, final_y=None):
+        if self._zip is None:
+            return
+        self._flush()
+        if final_x is not None:
+            self._zip.writestr("final/x.npy", _array_bytes(np.asarray(final_x)))
+            self._zip.writestr("final/y.npy", _array_bytes(np.asarray(final_y)))
+
+        self.metadata["num_snapshots"] = self.num_snapshots
+        self.metadata.setdefault("complete", True)
+        self._zip.writestr(
+            "meta.json", json.dumps(self.metadata, indent=4, default=_json_default)
+        )
+        self._zip.close()
+        self._zip = None
+
+    @staticmethod
+    def save_history(sim, path, **kwargs):
+        """
+        Сохраняет уже накопленную в памяти историю движка в архив.
+        При трассерах в архив попадают только они, а MSD всего ансамбля
+        сохраняется в метаданных.
+        """
+        writer = TrajectoryArchiveWriter(path, **kwargs)
+        idx = sim.tracer_indices() if hasattr(sim, "tracer_indices") else None
+        final_x, final_y = sim.x, sim.y
+        if idx is not None:
+            final_x, final_y = sim.x[idx], sim.y[idx]
+        writer.open(
+            len(final_x),
+            sim.history_step,
+            config=sim.config,
+            geometry_state=_geometry_state(sim.geo_strategy),
+        )
+        if getattr(sim, "msd", None) is not None:
+            writer.metadata["msd"] = sim.msd
+            writer.metadata["moments"] = getattr(sim, "moments", None)
+        for hx, hy in zip(sim.history_x, sim.history_y):
+            writer.append(hx, hy)
+        writer.close(final_x=final_x, final_y=final_y)
+        return path
+
+
+class ArchivedRun:
+    """
+    Прогон, восстановленный из архива. Повторяет интерфейс SimulationEngine,
+    который используют PhysicsAnalyzer и SimulationPlotter.
+    """
+
+    def __init__(
+        self,
+        history_x,
+        history_y,
+        history_step,
+        x,
+        y,
+        geo_strategy,
+        config,
+        msd=None,
+        moments=None,
+    ):
+        self.history_x = history_x
+        self.history_y = history_y
+        self.history_step = history_step
+        self.x = x
+        self.y = y
+        self.num_trajectories = len(x)
+        self.geo_strategy = geo_strategy
+        self.config = config
+        # MSD и моменты смещений всего ансамбля, посчитанные при записи
+        self.msd = msd
+        self.moments = moments
+
+
+class TrajectoryArchive:
+    """
+    Чтение архива траекторий. Распаковываются только чанки, пересекающие
+    запрошенные частицы и временное окно.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path, "r")
+        self.meta = json.loads(self._zip.read("meta.json"))
+
+        self.num_particles = self.meta["num_particles"]
+        self.num_snapshots = self.meta["num_snapshots"]
+        self.history_step = self.meta["history_step"]
+        self.config = self.meta["config"]
+        # False — расчет прерван, архив содержит снимки до прерывания
+        self.complete = self.meta.get("complete", True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+
+    @staticmethod
+    def _indices(selection, size):
+        if selection is None:
+            return np.arange(size)
+        return np.arange(size)[selection]
+
+    def load(self, particles=None, snapshots=None):
+        """
+        Возвращает (history_x, history_y) формы (снимки, частицы).
+        particles / snapshots: None (все), slice или массив индексов.
+        """
+        p_idx = self._indices(particles, self.num_particles)
+        t_idx = self._indices(snapshots, self.num_snapshots)
+        cs = self.meta["chunk_snapshots"]
+        cp = self.meta["chunk_particles"]
+        precision = self.meta["precision"]
+
+        out_x = np.empty((len(t_idx), len(p_idx)))
+        out_y = np.empty((len(t_idx), len(p_idx)))
+
+        for t_chunk in np.unique(t_idx // cs):
+            t_sel = np.nonzero(t_idx // cs == t_chunk)[0]
+            t_local = t_idx[t_sel] - t_chunk * cs
+            for p_chunk in np.unique(p_idx // cp):
+                p_sel = np.nonzero(p_idx // cp == p_chunk)[0]
+                p_local = p_idx[p_sel] - p_chunk * cp
+                name = f"t{t_chunk:06d}_p{p_chunk:06d}.npy"
+
+                block_x = _decode_chunk(self._zip.read(f"x/{name}"), precision)
+                block_y = _decode_chunk(self._zip.read(f"y/{name}"), precision)
+                out_x[np.ix_(t_sel, p_sel)] = block_x[np.ix_(t_local, p_local)]
+                out_y[np.ix_(t_sel, p_sel)] = block_y[np.ix_(t_local, p_local)]
+
+        return out_x, out_y
+
+    def final_positions(self, particles=None):
+        """Точные (без квантования) конечные координаты частиц."""
+        p_idx = self._indices(particles, self.num_particles)
+        if "final/x.npy" not in self._zip.namelist():
+            hx, hy = self.load(p_idx, [self.num_snapshots - 1])
+            return hx[0], hy[0]
+        x = np.load(io.BytesIO(self._zip.read("final/x.npy")))
+        y = np.load(io.BytesIO(self._zip.read("final/y.npy")))
+        return x[p_idx], y[p_idx]
+
+    def geometry(self):
+        state = self.meta.get("geometry")
+        return _restore_geometry(state) if state else None
+
+    def to_sim(self, particles=None, snapshots=None):
+        """
+        Собирает ArchivedRun для аналитики и графиков без повторной симуляции.
+        Шаг истории учитывает прореживание снимков (slice со step).
+        """
+        hx, hy = self.load(particles, snapshots)
+        x, y = self.final_positions(particles)
+
+        stride = 1
+        if isinstance(snapshots, slice) and snapshots.step:
+            stride = snapshots.step
+
+        msd = self.meta.get("msd")
+        moments = self.meta.get("moments")
+        if msd is not None and snapshots is not None:
+            msd = np.asarray(msd)[snapshots]
+        if moments is not None and snapshots is not None:
+            moments = np.asarray(moments)[snapshots]
+
+        return ArchivedRun(
+            hx,
+            hy,
+            self.history_step * stride,
+            x,
+            y,
+            self.geometry(),
+            self.config,
+            msd,
+            moments,
+        )
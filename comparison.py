@@ -0,0 +1,235 @@
+import copy
+import time
+
+import numpy as np
+
+from analytics import PhysicsAnalyzer
+from simulation import SimulationEngine, StrategyFactory
+
+
+class CommonRandomComparison:
+    """
+    Сравнение нескольких геометрий на общем потоке случайных чисел (CRN).
+
+    Все геометрии получают одни и те же смещения на каждом шаге, поэтому
+    разница D_eff (и τ) между ними определяется геометрией, а не шумом
+    выборки.
+
+    geometries: список типов ('parallel', 'circle', ...) или словарь
+    {имя: тип или экземпляр GeometryStrategy}.
+    """
+
+    def __init__(
+        self,
+        geometries,
+        num_trajectories=2000,
+        num_steps=1000,
+        movement_type="normal",
+        **kwargs,
+    ):
+        if not isinstance(geometries, dict):
+            geometries = {geo: geo for geo in geometries}
+        if len(geometries) == 0:
+            raise ValueError("At least one geometry is required")
+
+        if kwargs.get("antithetic"):
+            raise ValueError(
+                "Antithetic pairs give the same r^2 as their partners and halve "
+                "the effective sample size of the MSD estimator"
+            )
+
+        self.num_trajectories = num_trajectories
+        self.num_steps = num_steps
+        self.history_step = 100
+
+        self.move_strategy = StrategyFactory.create(movement_type, **kwargs)
+
+        # Один движок на геометрию; движение берется из общего потока
+        self.engines = {
+            name: SimulationEngine(
+                num_trajectories=num_trajectories,
+                num_steps=num_steps,
+                movement_type=movement_type,
+                geometry_type=geo,
+                **kwargs,
+            )
+            for name, geo in geometries.items()
+        }
+
+    def run(self):
+        print(
+            f"CRN comparison: {self.num_trajectories} particles, "
+            f"Geometries: {', '.join(self.engines)}"
+        )
+
+        for sim in self.engines.values():
+            sim.history_step = self.history_step
+            sim.record_history()
+
+        for step in range(1, self.num_steps + 1):
+            # Одни и те же смещения для всех геометрий
+            dx, dy = self.move_strategy.get_displacement(self.num_trajectories)
+
+            for sim in self.engines.values():
+                sim.advance(dx, dy)
+
+            if step % self.history_step == 0:
+                for sim in self.engines.values():
+                    sim.record_history()
+
+        print("Done.")
+
+    @staticmethod
+    def _var_of_mean(samples):
+        return np.var(samples, ddof=1) / len(samples)
+
+    def report(self, reference=None):
+        """
+        Сводка по геометриям и их разностям с эталонной (по умолчанию первой).
+
+        Для каждой разности: variance_reduction = Var(независимые прогоны) /
+        Var(общий поток).
+        """
+        slopes = {
+            name: PhysicsAnalyzer.calculate_particle_slopes(sim)
+            for name, sim in self.engines.items()
+        }
+        if reference is None:
+            reference = next(iter(slopes))
+
+        geometries = {}
+        for name, s in slopes.items():
+            slope = np.mean(s)
+            var = self._var_of_mean(s)
+            entry = {
+                "slope": slope,
+                "slope_err": np.sqrt(var),
+                "tortuosity": 1.0 / slope,
+                "tortuosity_err": np.sqrt(var) / slope**2,
+            }
+            geometries[name] = entry
+
+        differences = {}
+        ref = slopes[reference]
+        for name, s in slopes.items():
+            if name == reference:
+                continue
+            # Общий поток: дисперсия парной разности
+            var_crn = self._var_of_mean(s - ref)
+            # Независимые прогоны: дисперсии складываются
+            var_indep = self._var_of_mean(s) + self._var_of_mean(ref)
+            differences[name] = {
+                "slope_diff": np.mean(s) - np.mean(ref),
+                "slope_diff_err": np.sqrt(var_crn),
+                "variance_reduction": var_indep / var_crn if var_crn > 0 else np.inf,
+            }
+
+        return {
+            "reference": reference,
+            "geometries": geometries,
+            "differences": differences,
+        }
+
+
+class CollisionBenchmark:
+    """
+    Точность и стоимость проверки столкновений со случайными препятствиями:
+    режим endpoint (только конечная точка шага) против continuous
+    (пересечение отрезка с окружностями и зеркальное отражение).
+
+    Для каждого масштаба шага s (sigma = s * r_obs по каждой оси) оба режима
+    идут на общих смещениях (CRN) одинаковое физическое время
+    duration * r_obs^2, т.е. duration / s^2 шагов. Эталон — режим
+    continuous с самым мелким шагом. Отчет для каждого режима:
+    d_ratio = MSD / MSD свободной диффузии (D_eff / D_0), отклонение от
+    эталона, время проверки на частицу-шаг и доля шагов, на которых
+    endpoint пропустил пересечение с препятствием (tunnel_rate).
+    """
+
+    MODES = ("endpoint", "continuous")
+
+    def __init__(
+        self,
+        geometry,
+        step_scales=(0.25, 0.5, 1.0, 2.0),
+        num_trajectories=5000,
+        duration=100.0,
+        seed=None,
+    ):
+        self.geometry = geometry
+        self.step_scales = sorted(step_scales)
+        self.num_trajectories = num_trajectories
+        self.duration = duration
+        self.rng = np.random.default_rng(seed)
+        self.results = {}
+
+        # Стартовые точки в центральной части поля, вне препятствий
+        half = 0.5 * geometry.field_size
+        x = self.rng.uniform(-half, half, num_trajectories)
+        y = self.rng.uniform(-half, half, num_trajectories)
+        start = copy.copy(geometry)
+        start.collision = "endpoint"
+        self.x0, self.y0 = start.apply_boundaries(x, y, x, y)
+
+    def run(self):
+        r = self.geometry.r_obs
+        for scale in self.step_scales:
+            sigma = scale * r
+            num_steps = max(int(round(self.duration / scale**2)), 1)
+            geos = {}
+            for mode in self.MODES:
+                geos[mode] = copy.copy(self.geometry)
+                geos[mode].collision = mode
+            state = {mode: (self.x0, self.y0) for mode in self.MODES}
+            seconds = dict.fromkeys(self.MODES, 0.0)
+            tunneled = 0
+
+            for _ in range(num_steps):
+                dx = self.rng.normal(0.0, sigma, self.num_trajectories)
+                dy = self.rng.normal(0.0, sigma, self.num_trajectories)
+                for mode, geo in geos.items():
+                    x, y = state[mode]
+                    started = time.perf_counter()
+                    new_x, new_y = geo.apply_boundaries(x, y, x + dx, y + dy)
+                    seconds[mode] += time.perf_counter() - started
+                    state[mode] = (new_x, new_y)
+                    if mode == "endpoint":
+                        # Пересечение, не замеченное проверкой конечной точки
+                        cx, cy = geos["continuous"].apply_boundaries(
+                            x, y, x + dx, y + dy
+                        )
+                        missed = (cx != x + dx) | (cy != y + dy)
+                        missed &= (new_x == x + dx) & (new_y == y + dy)
+                        tunneled += np.count_nonzero(missed)
+
+            msd_free = 2.0 * sigma**2 * num_steps
+            particle_steps = self.num_trajectories * num_steps
+            for mode, (x, y) in state.items():
+                msd = np.mean((x - self.x0) ** 2 + (y - self.y0) ** 2)
+                self.results[(scale, mode)] = {
+                    "steps": num_steps,
+                    "d_ratio": msd / msd_free,
+                    "seconds_per_step": seconds[mode] / particle_steps,
+                    "tunnel_rate": (
+                        tunneled / particle_steps if mode == "endpoint" else 0.0
+                    ),
+                }
+
+        reference = self.results[(self.step_scales[0], "continuous")]["d_ratio"]
+        for entry in self.results.values():
+            entry["d_error"] = entry["d_ratio"] / reference - 1.0
+        return self.results
+
+    def report(self):
+        lines = [
+            f"{'step/r':>7} {'mode':10} {'steps':>6} {'D/D0':>7} "
+            f"{'error':>8} {'tunnel':>8} {'ns/step':>8}"
+        ]
+        for (scale, mode), entry in self.results.items():
+            lines.append(
+                f"{scale:7.2f} {mode:10} {entry['steps']:6d} "
+                f"{entry['d_ratio']:7.4f} {100 * entry['d_error']:7.2f}% "
+                f"{100 * entry['tunnel_rate']:7.3f}% "
+                f"{1e9 * entry['seconds_per_step']:8.1f}"
+            )
+        return "\n".join(lines)
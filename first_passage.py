@@ -0,0 +1,106 @@
+import numpy as np
+
+from simulation import SnapshotObserver
+
+NOT_REACHED = -1
+
+
+# --- ЦЕЛИ (Границы первого достижения) ---
+
+
+class RadiusTarget:
+    """Частица достигла окружности радиуса radius (r >= radius)."""
+
+    def __init__(self, radius):
+        self.radius = radius
+
+    def bind(self, sim):
+        pass
+
+    def reached(self, x, y):
+        return x**2 + y**2 >= self.radius**2
+
+    def __repr__(self):
+        return f"r={self.radius:g}"
+
+
+class BarrierRowTarget:
+    """
+    Частица попала в полосу с индексом row (floor(y / barrier_dist)).
+    Для row > 0 считается достижение полосы row и выше, для row <= 0 —
+    полосы row и ниже. barrier_dist по умолчанию берется из геометрии.
+    """
+
+    def __init__(self, row, barrier_dist=None):
+        self.row = row
+        self.barrier_dist = barrier_dist
+
+    def bind(self, sim):
+        if self.barrier_dist is None:
+            if not hasattr(sim.geo_strategy, "barrier_dist"):
+                raise ValueError("barrier_dist is required for this geometry")
+            self.barrier_dist = sim.geo_strategy.barrier_dist
+
+    def reached(self, x, y):
+        idx = np.floor(y / self.barrier_dist)
+        if self.row > 0:
+            return idx >= self.row
+        return idx <= self.row
+
+    def __repr__(self):
+        return f"row={self.row}"
+
+
+# --- РЕГИСТРАТОР ---
+
+
+class FirstPassageRecorder(SnapshotObserver):
+    """
+    Времена первого достижения целей, фиксируемые на каждом шаге.
+
+    На цель хранится один целочисленный массив times[name] (шаг первого
+    достижения, NOT_REACHED = -1 для еще не достигших) и булева маска
+    "еще не достигли" по всем частицам. Условие цели проверяется только
+    для частиц из маски, поэтому стоимость падает по мере их выбывания.
+    История траекторий не нужна. В блочном режиме движка (chunk_size)
+    блоки обновляют свои непересекающиеся срезы маски.
+
+    targets: список целей или словарь {имя: цель}.
+    """
+
+    def __init__(self, targets):
+        if not isinstance(targets, dict):
+            targets = {repr(t): t for t in targets}
+        self.targets = targets
+        self.times = {}
+        self.num_steps = 0
+        self._pending = {}
+
+    def on_start(self, sim):
+        if sim.adaptive_miss:
+            raise ValueError("first-passage times need per-step updates")
+        self.num_steps = sim.num_steps
+        dtype = np.int32 if sim.num_steps < np.iinfo(np.int32).max else np.int64
+        for name, target in self.targets.items():
+            target.bind(sim)
+            self.times[name] = np.full(sim.num_trajectories, NOT_REACHED, dtype)
+            self._pending[name] = np.ones(sim.num_trajectories, dtype=bool)
+        self.update(0, sim.x, sim.y)
+
+    def on_step(self, sim, step):
+        self.update(step, sim.x, sim.y)
+
+    def on_chunk_step(self, sim, step, x, y, offset):
+        self.update(step, x, y, offset)
+
+    def update(self, step, x, y, offset=0):
+        """x, y — координаты частиц offset..offset+len(x)."""
+        for name, target in self.targets.items():
+            mask = self._pending[name][offset : offset + len(x)]
+            pending = np.flatnonzero(mask)
+            if len(pending) == 0:
+                continue
+            hit = pending[target.reached(x[pending], y[pending])]
+            if len(hit):
+                self.times[name][offset + hit] = step
+                mask[hit] = False
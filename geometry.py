@@ -1,22 +1,30 @@
 from abc import ABC, abstractmethod
 
-import matplotlib.patches
-import matplotlib.pyplot as plt
 import numpy as np
 
 
 class GeometryStrategy(ABC):
     """
     Абстрактная стратегия геометрии.
+    Физика столкновений зависит только от NumPy; отрисовка вынесена
+    в rendering.py и импортируется лениво при первом вызове draw.
     """
 
     @abstractmethod
     def apply_boundaries(self, old_x, old_y, new_x, new_y):
         pass
 
-    @abstractmethod
+    def wall_distance(self, x, y):
+        """
+        Расстояние от частиц до ближайшей стены (нижняя оценка), по которому
+        движок выбирает длину объединенного шага. None — не поддерживается.
+        """
+        return None
+
     def draw(self, ax, x_lim, y_lim):
-        pass
+        from rendering import GeometryRenderer
+
+        GeometryRenderer.draw(self, ax, x_lim, y_lim)
 
 
 # --- 1. ПАРАЛЛЕЛЬНЫЕ ЛИНИИ ---
@@ -66,32 +74,10 @@ class ParallelLinesGeometry(GeometryStrategy):
 
         return new_x, final_y
 
-    def draw(self, ax, x_lim, y_lim):
-        ymin, ymax = y_lim
-        xmin, xmax = x_lim
-        min_k = int(np.floor(ymin / self.barrier_dist))
-        max_k = int(np.ceil(ymax / self.barrier_dist))
-        L = self.hole_size * 4.0
-
-        for k in range(min_k, max_k + 1):
-            if k == 0:
-                continue
-            y_pos = k * self.barrier_dist
-            offset = (L / 2.0) if (k % 2 != 0) else 0.0
-
-            start_n = int(np.floor((xmin - offset) / L)) - 1
-            end_n = int(np.ceil((xmax - offset) / L)) + 1
-
-            for n in range(start_n, end_n):
-                center = n * L + offset
-                wall_start_x = center + self.hole_size / 2.0
-                wall_end_x = (center + L) - self.hole_size / 2.0
-
-                if wall_end_x < xmin or wall_start_x > xmax:
-                    continue
-                ax.plot(
-                    [wall_start_x, wall_end_x], [y_pos, y_pos], color="black", lw=1.5
-                )
+    def wall_distance(self, x, y):
+        # Дырки не учитываются: расстояние до ряда барьеров по y
+        offset = np.mod(y, self.barrier_dist)
+        return np.minimum(offset, self.barrier_dist - offset)
 
 
 # --- 2. ПУСТОЕ ПРОСТРАНСТВО ---
@@ -99,8 +85,8 @@ class EmptyGeometry(GeometryStrategy):
     def apply_boundaries(self, old_x, old_y, new_x, new_y):
         return new_x, new_y
 
-    def draw(self, ax, x_lim, y_lim):
-        pass
+    def wall_distance(self, x, y):
+        return np.full(np.shape(x), np.inf)
 
 
 # --- 3. КОНЦЕНТРИЧЕСКИЕ КРУГИ ---
@@ -165,44 +151,31 @@ class ConcentricCirclesGeometry(GeometryStrategy):
 
         return out_x, out_y
 
-    def draw(self, ax, x_lim, y_lim):
-        max_dim = max(abs(x_lim[1]), abs(y_lim[1]))
-        max_k = int(np.ceil(max_dim / self.radius_step))
-        L = self.hole_size * 4.0
-
-        for k in range(1, max_k + 1):
-            r = k * self.radius_step
-            circumference = 2 * np.pi * r
-            n_holes = int(circumference / L)
-            if n_holes == 0:
-                n_holes = 1
-
-            d_theta = (2 * np.pi) / n_holes
-            offset_angle = (d_theta / 2.0) if (k % 2 != 0) else 0.0
-            hole_angle = self.hole_size / r
-
-            for i in range(n_holes):
-                center_angle = i * d_theta + offset_angle
-                start_angle = center_angle + hole_angle / 2.0
-                end_angle = (center_angle + d_theta) - hole_angle / 2.0
-
-                theta1 = np.degrees(start_angle)
-                theta2 = np.degrees(end_angle)
-
-                arc = matplotlib.patches.Arc(
-                    (0, 0),
-                    2 * r,
-                    2 * r,
-                    theta1=theta1,
-                    theta2=theta2,
-                    color="black",
-                    lw=1.5,
-                )
-                ax.add_patch(arc)
+    def wall_distance(self, x, y):
+        # Расстояние по радиусу до ближайшего кольца
+        offset = np.mod(np.hypot(x, y), self.radius_step)
+        return np.minimum(offset, self.radius_step - offset)
 
 
 # --- 4. СЛУЧАЙНЫЕ ПРЕПЯТСТВИЯ ---
 class RandomObstaclesGeometry(GeometryStrategy):
+    """
+    Круглые препятствия радиуса r_obs в квадрате [-field_size, field_size]^2.
+
+    collision="endpoint" — проверяется только конечная точка шага, частица
+    внутри препятствия выталкивается по радиусу (шаг должен быть мал по
+    сравнению с r_obs, иначе частица «туннелирует» сквозь препятствие).
+    collision="continuous" — отрезок шага пересекается с окружностями,
+    частица зеркально отражается в точке удара и проходит остаток шага
+    (до MAX_BOUNCES отражений); кандидаты берутся из равномерной сетки
+    по препятствиям вдоль отрезка.
+    """
+
+    collision = "endpoint"
+    MAX_BOUNCES = 8
+    # Допуск точки на поверхности (доля r^2) для ошибок округления
+    SURFACE_TOL = 1e-9
+
     def __init__(self, num_obstacles=50, obstacle_radius=5.0, field_size=200.0):
         self.num_obstacles = num_obstacles
         self.r_obs = obstacle_radius
@@ -212,36 +185,315 @@ class RandomObstaclesGeometry(GeometryStrategy):
         self.centers_x = np.random.uniform(-field_size, field_size, num_obstacles)
         self.centers_y = np.random.uniform(-field_size, field_size, num_obstacles)
 
-    def apply_boundaries(self, old_x, old_y, new_x, new_y):
-        out_x = new_x.copy()
-        out_y = new_y.copy()
-
-        # Проверка коллизий с каждым препятствием
-        for cx, cy in zip(self.centers_x, self.centers_y):
-            dx = out_x - cx
-            dy = out_y - cy
-            dist_sq = dx**2 + dy**2
-            min_dist_sq = self.r_obs**2
-
-            mask_hit = dist_sq < min_dist_sq
-
-            if np.any(mask_hit):
-                # Упругое выталкивание частицы
-                dist = np.sqrt(dist_sq[mask_hit])
-                dist[dist == 0] = 0.001
-
-                norm_x = dx[mask_hit] / dist
-                norm_y = dy[mask_hit] / dist
-
-                out_x[mask_hit] = cx + norm_x * (self.r_obs + 0.01)
-                out_y[mask_hit] = cy + norm_y * (self.r_obs + 0.01)
-
-        return out_x, out_y
+    # Практический предел заполнения для случайной последовательной адсорбции
+    # (предел заклинивания дисков ~0.547, вблизи него прием падает до нуля)
+    MAX_PACKING = 0.5
+
+    @classmethod
+    def packed(
+        cls, porosity, obstacle_radius=5.0, field_size=200.0, seed=None, gap=0.0
+    ):
+        """
+        Непересекающиеся препятствия с заданной пористостью (доля свободной
+        площади квадрата [-field_size, field_size]^2; диски целиком внутри).
+
+        Случайная последовательная адсорбция на сетке: ячейка со стороной
+        d / sqrt(2) (d = 2r + gap) вмещает не больше одного центра, поэтому
+        кандидат проверяется только против окрестности 5x5 ячеек. Кандидаты
+        генерируются пачками и проверяются векторно; конфликт внутри пачки
+        отбрасывает более поздний кандидат.
+        """
+        coverage = 1.0 - porosity
+        if not 0.0 <= coverage <= cls.MAX_PACKING:
+            raise ValueError(
+                f"porosity must be in [{1.0 - cls.MAX_PACKING:g}, 1], got {porosity}"
+            )
+        rng = np.random.default_rng(seed)
+        r = obstacle_radius
+        d = 2.0 * r + gap
+        lo, hi = -field_size + r, field_size - r
+        target = int(round(coverage * (2.0 * field_size) ** 2 / (np.pi * r**2)))
+
+        cell = d / np.sqrt(2.0)
+        size = max(int(np.ceil((hi - lo) / cell)), 1)
+        grid = np.full((size, size), -1, dtype=np.int64)
+        centers_x = np.empty(target)
+        centers_y = np.empty(target)
+        offsets = [(i, j) for i in range(-2, 3) for j in range(-2, 3)]
+
+        count = 0
+        acceptance = 1.0
+        while count < target:
+            need = target - count
+            batch = int(min(max(1.5 * need / acceptance, 1024), 4_000_000))
+            x = rng.uniform(lo, hi, batch)
+            y = rng.uniform(lo, hi, batch)
+            ix = np.minimum(((x - lo) / cell).astype(np.int64), size - 1)
+            iy = np.minimum(((y - lo) / cell).astype(np.int64), size - 1)
+
+            # 1. Конфликты с уже размещенными препятствиями (сначала дешевый
+            # отсев по занятой собственной ячейке)
+            free = grid[iy, ix] < 0
+            x, y, ix, iy = x[free], y[free], ix[free], iy[free]
+            ok = np.ones(len(x), dtype=bool)
+            for di, dj in offsets:
+                if di == 0 and dj == 0:
+                    continue
+                jy, jx = iy + di, ix + dj
+                inside = (jy >= 0) & (jy < size) & (jx >= 0) & (jx < size)
+                occ = np.where(
+                    inside, grid[np.clip(jy, 0, size - 1), np.clip(jx, 0, size - 1)], -1
+                )
+                near = occ >= 0
+                dist_sq = np.full(len(x), np.inf)
+                dist_sq[near] = (x[near] - centers_x[occ[near]]) ** 2 + (
+                    y[near] - centers_y[occ[near]]
+                ) ** 2
+                ok &= dist_sq >= d**2
+            x, y, ix, iy = x[ok], y[ok], ix[ok], iy[ok]
+
+            # 2. Конфликты внутри пачки: побеждает более ранний кандидат
+            order = np.arange(len(x))
+            local = np.full((size, size), -1, dtype=np.int64)
+            local[iy[::-1], ix[::-1]] = order[::-1]
+            keep = local[iy, ix] == order
+            for di, dj in offsets:
+                if di == 0 and dj == 0:
+                    continue
+                jy, jx = iy + di, ix + dj
+                inside = (jy >= 0) & (jy < size) & (jx >= 0) & (jx < size)
+                occ = np.where(
+                    inside,
+                    local[np.clip(jy, 0, size - 1), np.clip(jx, 0, size - 1)],
+                    -1,
+                )
+                earlier = (occ >= 0) & (occ < order)
+                dist_sq = np.full(len(x), np.inf)
+                dist_sq[earlier] = (x[earlier] - x[occ[earlier]]) ** 2 + (
+                    y[earlier] - y[occ[earlier]]
+                ) ** 2
+                keep &= dist_sq >= d**2
+
+            accepted = np.nonzero(keep)[0][:need]
+            acceptance = max(len(accepted) / batch, 1e-4)
+            if len(accepted) == 0 and batch >= 4_000_000:
+                raise ValueError(f"porosity {porosity} is not reachable by RSA")
+
+            new = slice(count, count + len(accepted))
+            centers_x[new] = x[accepted]
+            centers_y[new] = y[accepted]
+            grid[iy[accepted], ix[accepted]] = np.arange(new.start, new.stop)
+            count += len(accepted)
+
+        geo = cls.__new__(cls)
+        geo.num_obstacles = target
+        geo.r_obs = r
+        geo.field_size = field_size
+        geo.centers_x = centers_x
+        geo.centers_y = centers_y
+        return geo
+
+    @property
+    def porosity(self):
+        """Доля свободной площади поля (без учета перекрытий препятствий)."""
+        covered = self.num_obstacles * np.pi * self.r_obs**2
+        return 1.0 - covered / (2.0 * self.field_size) ** 2
+
+    def save(self, path):
+        """Сохраняет среду (.npz) для повторного использования в серии."""
+        np.savez(
+            path,
+            centers_x=self.centers_x,
+            centers_y=self.centers_y,
+            obstacle_radius=self.r_obs,
+            field_size=self.field_size,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            geo = cls.__new__(cls)
+            geo.centers_x = data["centers_x"]
+            geo.centers_y = data["centers_y"]
+            geo.r_obs = float(data["obstacle_radius"])
+            geo.field_size = float(data["field_size"])
+        geo.num_obstacles = len(geo.centers_x)
+        return geo
 
-    def draw(self, ax, x_lim, y_lim):
-        for cx, cy in zip(self.centers_x, self.centers_y):
-            circle = plt.Circle((cx, cy), self.r_obs, color="black", alpha=0.5)
-            ax.add_patch(circle)
+    def apply_boundaries(self, old_x, old_y, new_x, new_y):
+        if self.collision == "continuous":
+            return self._apply_continuous(old_x, old_y, new_x, new_y)
+        if self.collision != "endpoint":
+            raise ValueError(f"Unknown collision mode: {self.collision}")
+
+        return self._push_out(
+            np.array(new_x, dtype=float), np.array(new_y, dtype=float)
+        )
+
+    # --- Сеточный индекс препятствий ---
+
+    def _obstacle_index(self):
+        """
+        Сетка с ячейкой h = 2 r_obs по препятствиям (CSR: номера препятствий
+        ячейки c — order[starts[c]:starts[c + 1]]). Строится один раз.
+        """
+        index = getattr(self, "_index", None)
+        if index is not None and index[-1] == len(self.centers_x):
+            return index
+        h = 2.0 * self.r_obs
+        origin = -self.field_size - self.r_obs
+        size = max(int(np.ceil(2.0 * (self.field_size + self.r_obs) / h)), 1)
+        ix = np.clip(((self.centers_x - origin) / h).astype(np.intp), 0, size - 1)
+        iy = np.clip(((self.centers_y - origin) / h).astype(np.intp), 0, size - 1)
+        cell = iy * size + ix
+        order = np.argsort(cell, kind="stable")
+        starts = np.searchsorted(cell[order], np.arange(size * size + 1))
+        self._index = (h, origin, size, starts, order, len(self.centers_x))
+        return self._index
+
+    def _candidates(self, ax, ay, bx, by):
+        """
+        Пары (отрезок, препятствие), которые могут пересекаться: отрезок
+        режется на куски не длиннее h, рамка куска, расширенная на r_obs,
+        задевает не больше 3x3 ячеек. Пары могут повторяться.
+        """
+        h, origin, size, starts, order, _ = self._obstacle_index()
+        r = self.r_obs
+        length = np.hypot(bx - ax, by - ay)
+        pieces = np.maximum(np.ceil(length / h), 1).astype(np.intp)
+        seg = np.repeat(np.arange(len(ax)), pieces)
+        first = np.repeat(np.cumsum(pieces) - pieces, pieces)
+        k = np.arange(len(seg)) - first
+        t0 = k / pieces[seg]
+        t1 = (k + 1) / pieces[seg]
+        px0, px1 = ax[seg] + t0 * (bx - ax)[seg], ax[seg] + t1 * (bx - ax)[seg]
+        py0, py1 = ay[seg] + t0 * (by - ay)[seg], ay[seg] + t1 * (by - ay)[seg]
+
+        lo_x = np.floor((np.minimum(px0, px1) - r - origin) / h).astype(np.intp)
+        hi_x = np.floor((np.maximum(px0, px1) + r - origin) / h).astype(np.intp)
+        lo_y = np.floor((np.minimum(py0, py1) - r - origin) / h).astype(np.intp)
+        hi_y = np.floor((np.maximum(py0, py1) + r - origin) / h).astype(np.intp)
+
+        seg_parts, cell_parts = [], []
+        for i in range(3):
+            for j in range(3):
+                cx, cy = lo_x + i, lo_y + j
+                ok = (cx <= hi_x) & (cy <= hi_y)
+                ok &= (cx >= 0) & (cx < size) & (cy >= 0) & (cy < size)
+                seg_parts.append(seg[ok])
+                cell_parts.append(cy[ok] * size + cx[ok])
+        seg = np.concatenate(seg_parts)
+        cell = np.concatenate(cell_parts)
+
+        counts = starts[cell + 1] - starts[cell]
+        seg = np.repeat(seg, counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        pos = np.repeat(starts[cell], counts) + np.arange(len(seg)) - first
+        return seg, order[pos]
+
+    def _apply_continuous(self, old_x, old_y, new_x, new_y):
+        r = self.r_obs
+        x = np.array(old_x, dtype=float)
+        y = np.array(old_y, dtype=float)
+        dx = new_x - old_x
+        dy = new_y - old_y
+        started_inside = np.zeros(len(x), dtype=bool)
+
+        active = np.arange(len(x))
+        for _ in range(self.MAX_BOUNCES):
+            ax, ay = x[active], y[active]
+            sx, sy = dx[active], dy[active]
+            seg, obs = self._candidates(ax, ay, ax + sx, ay + sy)
+
+            # |f + t d|^2 = r^2, f = начало - центр; b — половина линейного
+            # коэффициента. Удар — движение внутрь (b < 0) снаружи или с
+            # поверхности (c >= -tol, в т.ч. после отражения) при t <= 1.
+            fx = ax[seg] - self.centers_x[obs]
+            fy = ay[seg] - self.centers_y[obs]
+            a = sx[seg] ** 2 + sy[seg] ** 2
+            b = fx * sx[seg] + fy * sy[seg]
+            c = fx**2 + fy**2 - r**2
+            outside = c >= -self.SURFACE_TOL * r**2
+            started_inside[active[seg[~outside]]] = True
+            disc = b**2 - a * c
+            hit = outside & (b < 0) & (disc >= 0)
+            seg, obs = seg[hit], obs[hit]
+            t = np.maximum((-b[hit] - np.sqrt(disc[hit])) / a[hit], 0.0)
+            near = t <= 1.0
+            seg, obs, t = seg[near], obs[near], t[near]
+
+            # Первый удар на отрезке: минимальное t для каждой частицы
+            order = np.lexsort((t, seg))
+            seg, obs, t = seg[order], obs[order], t[order]
+            seg, first = np.unique(seg, return_index=True)
+            obs, t = obs[first], t[first]
+
+            free = np.ones(len(active), dtype=bool)
+            free[seg] = False
+            done = active[free]
+            x[done] += dx[done]
+            y[done] += dy[done]
+            if len(seg) == 0:
+                break
+
+            # Зеркальное отражение остатка шага от касательной в точке удара
+            idx = active[seg]
+            hx = x[idx] + t * dx[idx]
+            hy = y[idx] + t * dy[idx]
+            nx = (hx - self.centers_x[obs]) / r
+            ny = (hy - self.centers_y[obs]) / r
+            rx = (1.0 - t) * dx[idx]
+            ry = (1.0 - t) * dy[idx]
+            dot = rx * nx + ry * ny
+            x[idx], y[idx] = hx, hy
+            dx[idx] = rx - 2.0 * dot * nx
+            dy[idx] = ry - 2.0 * dot * ny
+            # При исчерпании лимита частицы остаются в последней точке удара
+            active = idx
+
+        if started_inside.any():
+            x, y = self._push_out(x, y, np.nonzero(started_inside)[0])
+        return x, y
+
+    def _push_out(self, x, y, idx=None):
+        """
+        Выталкивание по радиусу частиц idx (None — всех), оказавшихся внутри
+        препятствий: проверка конечной точки шага (endpoint) и частицы,
+        начавшие шаг внутри препятствия, в режиме continuous.
+
+        Повторяет последовательный проход по препятствиям в порядке номеров:
+        вытолкнутая частица проверяется только препятствиями с большими
+        номерами. Кандидаты берутся из сеточного индекса (отрезки нулевой
+        длины в _candidates), а не перебором всех препятствий.
+        """
+        r = self.r_obs
+        idx = np.arange(len(x)) if idx is None else idx
+        last = np.full(len(x), -1)
+        while len(idx):
+            seg, obs = self._candidates(x[idx], y[idx], x[idx], y[idx])
+            ddx = x[idx][seg] - self.centers_x[obs]
+            ddy = y[idx][seg] - self.centers_y[obs]
+            inside = (ddx**2 + ddy**2 < r**2) & (obs > last[idx][seg])
+            seg, obs = seg[inside], obs[inside]
+            if len(seg) == 0:
+                break
+
+            # Препятствие с наименьшим номером для каждой частицы
+            order = np.lexsort((obs, seg))
+            seg, obs = seg[order], obs[order]
+            seg, first = np.unique(seg, return_index=True)
+            obs = obs[first]
+
+            part = idx[seg]
+            ddx = x[part] - self.centers_x[obs]
+            ddy = y[part] - self.centers_y[obs]
+            dist = np.sqrt(ddx**2 + ddy**2)
+            dist[dist == 0] = 0.001
+            x[part] = self.centers_x[obs] + ddx / dist * (r + 0.01)
+            y[part] = self.centers_y[obs] + ddy / dist * (r + 0.01)
+            last[part] = obs
+            idx = part
+        return x, y
 
 
 # --- ФАБРИКА ---
@@ -261,10 +513,23 @@ class GeometryFactory:
                 hole_size=kwargs.get("hole_size", 10.0),
             )
         elif geo_type == "random":
-            return RandomObstaclesGeometry(
-                num_obstacles=kwargs.get("num_obstacles", 50),
-                obstacle_radius=kwargs.get("hole_size", 5.0),
-                field_size=200.0,
-            )
+            if kwargs.get("obstacles_path"):
+                geo = RandomObstaclesGeometry.load(kwargs["obstacles_path"])
+            elif kwargs.get("porosity") is not None:
+                geo = RandomObstaclesGeometry.packed(
+                    kwargs["porosity"],
+                    obstacle_radius=kwargs.get("hole_size", 5.0),
+                    field_size=kwargs.get("field_size", 200.0),
+                    seed=kwargs.get("obstacle_seed"),
+                )
+            else:
+                geo = RandomObstaclesGeometry(
+                    num_obstacles=kwargs.get("num_obstacles", 50),
+                    obstacle_radius=kwargs.get("hole_size", 5.0),
+                    field_size=200.0,
+                )
+            if kwargs.get("collision"):
+                geo.collision = kwargs["collision"]
+            return geo
         else:
             raise ValueError(f"Unknown geometry type: {geo_type}")
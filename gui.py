@@ -1,4 +1,6 @@
 import json  # <--- Для работы с конфигами
+import os
+import tempfile
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 
@@ -7,6 +9,11 @@ import numpy as np
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 
 from analytics import PhysicsAnalyzer
+from archive import TrajectoryArchive, TrajectoryArchiveWriter
+from density import DensityField
+from jobqueue import JobQueue
+from live_preview import LivePreview
+from planner import RunPlanner
 from plotting import SimulationPlotter
 
 # Импорт наших модулей
@@ -23,6 +30,7 @@ class ScientificApp(tk.Tk):
         # Переменные
         self.current_sim = None
         self.current_analytics_data = {}
+        self.queue_path = "jobs.sqlite"
 
         # Стили
         style = ttk.Style()
@@ -65,9 +73,24 @@ class ScientificApp(tk.Tk):
             label="💾 Сохранить настройки (JSON)...", command=self.save_config
         )
         file_menu.add_separator()
+        file_menu.add_command(
+            label="📼 Открыть архив траекторий...", command=self.load_archive
+        )
+        file_menu.add_separator()
         file_menu.add_command(label="Выход", command=self.quit)
 
         menubar.add_cascade(label="Файл", menu=file_menu)
+
+        # Меню "Очередь" (пакетные расчеты, выполняет `python main.py worker`)
+        queue_menu = tk.Menu(menubar, tearoff=0)
+        queue_menu.add_command(
+            label="➕ Поставить текущие настройки в очередь", command=self.submit_job
+        )
+        queue_menu.add_command(label="📋 Задания...", command=self.browse_jobs)
+        queue_menu.add_separator()
+        queue_menu.add_command(label="Файл очереди...", command=self.choose_queue_file)
+
+        menubar.add_cascade(label="Очередь", menu=queue_menu)
         self.config(menu=menubar)
 
     def create_settings_widgets(self):
@@ -99,15 +122,23 @@ class ScientificApp(tk.Tk):
             row=5, column=0, sticky="w", pady=5
         )
         self.combo_move = ttk.Combobox(
-            self.left_panel, values=["normal", "maxwell"], state="readonly"
+            self.left_panel, values=["normal", "maxwell", "levy"], state="readonly"
         )
         self.combo_move.current(0)
         self.combo_move.grid(row=5, column=1, pady=5)
 
+        # Живой просмотр во время расчета
+        self.var_live = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            self.left_panel, text="Живой просмотр", variable=self.var_live
+        ).grid(row=6, column=0, columnspan=2, sticky="w", pady=5)
+        self.inp_live_fps = add_param("Кадров/с:", "15", 7)
+        self.inp_live_subsample = add_param("Частиц в просмотре:", "500", 8)
+
         self.btn_run = ttk.Button(
             self.left_panel, text="▶ ЗАПУСК", command=self.run_simulation
         )
-        self.btn_run.grid(row=6, column=0, columnspan=2, pady=20, sticky="ew")
+        self.btn_run.grid(row=9, column=0, columnspan=2, pady=20, sticky="ew")
 
     def create_results_and_export_widgets(self):
         self.txt_results = tk.Text(
@@ -157,6 +188,22 @@ class ScientificApp(tk.Tk):
         )
         self.btn_save_conc.pack(fill=tk.X, pady=2)
 
+        self.btn_save_density = ttk.Button(
+            self.right_panel,
+            text="💾 Карта Концентрации",
+            command=self.save_density_plot,
+            state="disabled",
+        )
+        self.btn_save_density.pack(fill=tk.X, pady=2)
+
+        self.btn_save_archive = ttk.Button(
+            self.right_panel,
+            text="💾 Траектории (архив)",
+            command=self.save_archive,
+            state="disabled",
+        )
+        self.btn_save_archive.pack(fill=tk.X, pady=2)
+
     def create_plot_area(self):
         self.fig = plt.figure(figsize=(9, 9))
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.center_panel)
@@ -174,6 +221,9 @@ class ScientificApp(tk.Tk):
             "hole_size": self.inp_hole.get(),
             "geometry": self.combo_geo.get(),
             "movement": self.combo_move.get(),
+            "live_preview": self.var_live.get(),
+            "live_fps": self.inp_live_fps.get(),
+            "live_subsample": self.inp_live_subsample.get(),
         }
 
         filename = filedialog.asksaveasfilename(
@@ -218,10 +268,128 @@ class ScientificApp(tk.Tk):
                 if "movement" in config:
                     self.combo_move.set(config["movement"])
 
+                if "live_preview" in config:
+                    self.var_live.set(bool(config["live_preview"]))
+
+                if "live_fps" in config:
+                    self.inp_live_fps.delete(0, tk.END)
+                    self.inp_live_fps.insert(0, config["live_fps"])
+
+                if "live_subsample" in config:
+                    self.inp_live_subsample.delete(0, tk.END)
+                    self.inp_live_subsample.insert(0, config["live_subsample"])
+
                 messagebox.showinfo("Успех", "Настройки загружены!")
             except Exception as e:
                 messagebox.showerror("Ошибка", f"Неверный файл конфигурации:\n{e}")
 
+    # --- ОЧЕРЕДЬ ЗАДАНИЙ ---
+    def choose_queue_file(self):
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".sqlite",
+            initialfile=os.path.basename(self.queue_path),
+            filetypes=[("Job Queue", "*.sqlite")],
+            confirmoverwrite=False,
+        )
+        if filename:
+            self.queue_path = filename
+
+    def submit_job(self):
+        """Ставит текущие настройки в очередь заданий"""
+        try:
+            config = {
+                "num_trajectories": int(self.inp_particles.get()),
+                "num_steps": int(self.inp_steps.get()),
+                "movement_type": self.combo_move.get(),
+                "geometry_type": self.combo_geo.get(),
+                "barrier_dist": float(self.inp_barrier.get()),
+                "hole_size": float(self.inp_hole.get()),
+                "history_step": 10,
+                "save_archive": True,
+            }
+            with JobQueue(self.queue_path) as queue:
+                job_id = queue.submit(config)
+            messagebox.showinfo(
+                "Очередь", f"Задание {job_id} добавлено в {self.queue_path}"
+            )
+        except Exception as e:
+            messagebox.showerror("Ошибка", str(e))
+
+    def browse_jobs(self):
+        """Окно со списком заданий и их результатами"""
+        win = tk.Toplevel(self)
+        win.title(f"Задания: {self.queue_path}")
+        win.geometry("760x400")
+
+        columns = ("id", "name", "status", "tries", "runtime", "d_eff")
+        tree = ttk.Treeview(win, columns=columns, show="headings")
+        for col, title, width in zip(
+            columns,
+            ("№", "Имя", "Статус", "Попытки", "Время, с", "D_eff"),
+            (50, 200, 90, 80, 90, 90),
+        ):
+            tree.heading(col, text=title)
+            tree.column(col, width=width, anchor="center")
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        def refresh():
+            tree.delete(*tree.get_children())
+            with JobQueue(self.queue_path) as queue:
+                jobs = queue.jobs()
+            for job in jobs:
+                runtime = f"{job['runtime']:.1f}" if job["runtime"] is not None else ""
+                d_eff = f"{job['result']['d_eff']:.4f}" if job["result"] else ""
+                tree.insert(
+                    "",
+                    tk.END,
+                    iid=str(job["id"]),
+                    values=(
+                        job["id"],
+                        job["name"] or "",
+                        job["status"],
+                        f"{job['attempts']}/{job['max_attempts']}",
+                        runtime,
+                        d_eff,
+                    ),
+                )
+
+        def open_selected(event=None):
+            selection = tree.selection()
+            if selection:
+                self.show_job(int(selection[0]))
+
+        tree.bind("<Double-1>", open_selected)
+        buttons = ttk.Frame(win)
+        buttons.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Button(buttons, text="Обновить", command=refresh).pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Открыть результат", command=open_selected).pack(
+            side=tk.LEFT, padx=5
+        )
+        refresh()
+
+    def show_job(self, job_id):
+        """Выводит результаты задания; при наличии архива строит графики"""
+        try:
+            with JobQueue(self.queue_path) as queue:
+                job = queue.get(job_id)
+
+            self.txt_results.config(state="normal")
+            self.txt_results.delete(1.0, tk.END)
+            self.log_result(f"--- ЗАДАНИЕ {job_id}: {job['status']} ---")
+            self.log_result(json.dumps(job["config"], indent=1, ensure_ascii=False))
+            if job["result"]:
+                self.log_result(json.dumps(job["result"], indent=1, ensure_ascii=False))
+            if job["error"]:
+                self.log_result(job["error"])
+
+            archive_path = (job["result"] or {}).get("archive")
+            if archive_path and os.path.exists(archive_path):
+                with TrajectoryArchive(archive_path) as archive:
+                    sim = archive.to_sim()
+                self.display_results(sim, job["config"].get("geometry_type", "?"))
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось открыть задание:\n{e}")
+
     # --- ЛОГИКА СИМУЛЯЦИИ И ЭКСПОРТА (без изменений) ---
     def log_result(self, text):
         self.txt_results.config(state="normal")
@@ -238,8 +406,13 @@ class ScientificApp(tk.Tk):
         self.btn_save_map.config(state="normal")
         self.btn_save_diff.config(state="normal")
         self.btn_save_conc.config(state="normal")
+        self.btn_save_density.config(state="normal")
+        self.btn_save_archive.config(state="normal")
 
     def run_simulation(self):
+        # Живой просмотр обрабатывает события Tk во время расчета:
+        # повторный запуск до окончания текущего запрещен
+        self.btn_run.config(state="disabled")
         try:
             n_part = int(self.inp_particles.get())
             n_steps = int(self.inp_steps.get())
@@ -247,6 +420,7 @@ class ScientificApp(tk.Tk):
             hole = float(self.inp_hole.get())
             geo = self.combo_geo.get()
             move = self.combo_move.get()
+            live = self.var_live.get()
 
             self.txt_results.config(state="normal")
             self.txt_results.delete(1.0, tk.END)
@@ -262,68 +436,171 @@ class ScientificApp(tk.Tk):
                 hole_size=hole,
             )
             sim.history_step = 10
+            # История хранится только для рисуемых траекторий, MSD — по всем
+            sim.tracers = 100
+
+            # План памяти и времени до старта расчета
+            plan = RunPlanner(archive_dir=tempfile.gettempdir()).plan(sim)
+            self.log_result("--- ПЛАН ---")
+            self.log_result(plan.summary())
+            if not plan.feasible:
+                messagebox.showerror("Ошибка", f"Запуск невозможен:\n{plan.reason}")
+                return
+            archive_path = os.path.join(tempfile.gettempdir(), "last_run.traj")
+            plan.apply(sim, archive_path=archive_path)
+            self.update()
+
+            # Карта концентрации, усредненная по второй половине расчета
+            field = sim.add_observer(
+                DensityField(bins=80, window=(n_steps // 2, n_steps))
+            )
+            preview = None
+            if live:
+                preview = sim.add_observer(
+                    LivePreview(
+                        self.fig,
+                        subsample=int(self.inp_live_subsample.get()),
+                        fps=float(self.inp_live_fps.get()),
+                    )
+                )
             sim.run()
+            if preview is not None:
+                self.log_result(
+                    f"Кадров: {preview.frames}, "
+                    f"замедление: {100 * preview.overhead:.1f}%"
+                )
+
+            # Профиль по всем частицам, до замены движка подвыборкой из архива
+            profile = PhysicsAnalyzer.calculate_radial_concentration(sim, dr=4.0)
+            if plan.on_disk:
+                # История на диске: анализ по подвыборке частиц из архива
+                with TrajectoryArchive(archive_path) as archive:
+                    stride = -(-archive.num_particles // plan.analysis_particles)
+                    sim = archive.to_sim(particles=slice(0, None, stride))
+
+            self.display_results(sim, geo, field, profile=profile)
 
-            self.current_sim = sim
+        except Exception as e:
+            messagebox.showerror("Ошибка", str(e))
+        finally:
+            self.btn_run.config(state="normal")
+
+    def display_results(self, sim, geo, field=None, profile=None):
+        """
+        Аналитика и графики для готового прогона (движка или архива).
+        field: DensityField; без него карта строится по конечным позициям.
+        profile: готовый профиль C(r) (centers, counts, density); без него
+        считается по конечным позициям sim.
+        """
+        self.current_sim = sim
+
+        analyzer = PhysicsAnalyzer()
+        slope, r2 = analyzer.calculate_diffusion_coefficient(sim)
+        tortuosity = 1.0 / slope
+        if profile is None:
+            profile = analyzer.calculate_radial_concentration(sim, dr=4.0)
+        r_centers, counts, density = profile
+
+        self.current_analytics_data = {
+            "r_centers": r_centers,
+            "density": density,
+            "tortuosity": tortuosity,
+            "slope": slope,
+            "geo": geo,
+        }
 
-            analyzer = PhysicsAnalyzer()
-            slope, r2 = analyzer.calculate_diffusion_coefficient(sim)
-            tortuosity = 1.0 / slope
-            dr = 4.0
-            r_centers, counts, density = analyzer.calculate_radial_concentration(
-                sim, dr=dr
+        if field is None:
+            lim = SimulationPlotter._get_round_limit(
+                max(np.max(np.abs(sim.x)), np.max(np.abs(sim.y)), 10), step=20
             )
+            field = DensityField(bins=80, extent=(-lim, lim, -lim, lim))
+            field.accumulate(sim.x, sim.y)
+        self.current_analytics_data["field"] = field
+
+        self.log_result("\n--- ИТОГИ ---")
+        self.log_result(f"Геометрия: {geo}")
+        self.log_result(f"Tortuosity (τ): {tortuosity:.4f}")
+        self.log_result(f"D_eff slope: {slope:.4f}")
+        if getattr(sim, "moments", None) is not None:
+            tensor = analyzer.calculate_diffusion_tensor(sim)
+            (dxx, dxy), (_, dyy) = tensor["tensor"]
+            self.log_result(f"Dxx={dxx:.4f} Dyy={dyy:.4f} Dxy={dxy:.4f}")
+            self.log_result(
+                f"τ по главным осям: {tensor['tortuosity'][0]:.3f} / "
+                f"{tensor['tortuosity'][1]:.3f} (ось {tensor['angle']:.0f}°)"
+            )
+            if not tensor["diffusive"]:
+                self.log_result(
+                    f"⚠ |α2|={tensor['alpha2_max']:.3f}: режим еще не диффузионный"
+                )
 
-            self.current_analytics_data = {
-                "r_centers": r_centers,
-                "density": density,
-                "tortuosity": tortuosity,
-                "slope": slope,
-                "geo": geo,
-            }
-
-            self.log_result("\n--- ИТОГИ ---")
-            self.log_result(f"Геометрия: {geo}")
-            self.log_result(f"Tortuosity (τ): {tortuosity:.4f}")
-            self.log_result(f"D_eff slope: {slope:.4f}")
+        self._enable_export_buttons()
 
-            self._enable_export_buttons()
+        self.fig.clear()
 
-            self.fig.clear()
+        ax1 = self.fig.add_subplot(2, 2, 1)
+        limit = SimulationPlotter._get_round_limit(
+            max(np.max(np.abs(sim.x)), 10), step=20
+        )
+        if hasattr(sim, "geo_strategy"):
+            sim.geo_strategy.draw(ax1, (-limit, limit), (-limit, limit))
+        colors = plt.cm.rainbow(np.linspace(0, 1, 50))
+        hx, hy = np.array(sim.history_x), np.array(sim.history_y)
+        for i in range(min(50, hx.shape[1])):
+            ax1.plot(hx[:, i], hy[:, i], lw=0.5, alpha=0.6, color=colors[i])
+        ax1.set_title(f"Карта (τ={tortuosity:.2f})")
+        ax1.set_xlim(-limit, limit)
+        ax1.set_ylim(-limit, limit)
+        ax1.set_aspect("equal")
+
+        ax2 = self.fig.add_subplot(2, 2, 2)
+        steps, mean_r2 = PhysicsAnalyzer.calculate_msd(sim)
+        ax2.plot(steps, mean_r2, "b-", label="Sim")
+        ax2.plot(steps, steps, "k--", alpha=0.5, label="Theory")
+        ax2.set_title("MSD")
+        ax2.legend()
+
+        ax3 = self.fig.add_subplot(2, 2, 3)
+        ax3.plot(r_centers, density, "o-", color="purple", lw=2)
+        ax3.fill_between(r_centers, density, alpha=0.3, color="purple")
+        ax3.set_title("Концентрация C(r)")
+        ax3.grid(True)
+
+        ax4 = self.fig.add_subplot(2, 2, 4)
+        SimulationPlotter.draw_density_field(ax4, field, sim.geo_strategy)
+        ax4.set_title("Карта концентрации")
+
+        self.fig.tight_layout()
+        self.canvas.draw()
+
+    def load_archive(self):
+        """Открывает архив траекторий и перестраивает графики без симуляции"""
+        filename = filedialog.askopenfilename(
+            filetypes=[("Trajectory Archive", "*.traj"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        try:
+            with TrajectoryArchive(filename) as archive:
+                sim = archive.to_sim()
+            geo = sim.config.get("geometry_type", "?")
 
-            ax1 = self.fig.add_subplot(2, 2, 1)
-            limit = SimulationPlotter._get_round_limit(
-                max(np.max(np.abs(sim.x)), 10), step=20
-            )
-            if hasattr(sim, "geo_strategy"):
-                sim.geo_strategy.draw(ax1, (-limit, limit), (-limit, limit))
-            colors = plt.cm.rainbow(np.linspace(0, 1, 50))
-            hx, hy = np.array(sim.history_x), np.array(sim.history_y)
-            for i in range(min(50, n_part)):
-                ax1.plot(hx[:, i], hy[:, i], lw=0.5, alpha=0.6, color=colors[i])
-            ax1.set_title(f"Карта (τ={tortuosity:.2f})")
-            ax1.set_xlim(-limit, limit)
-            ax1.set_ylim(-limit, limit)
-            ax1.set_aspect("equal")
-
-            ax2 = self.fig.add_subplot(2, 2, 2)
-            X, Y = np.array(sim.history_x), np.array(sim.history_y)
-            mean_r2 = np.mean((X - X[0]) ** 2 + (Y - Y[0]) ** 2, axis=1)
-            steps = np.arange(len(mean_r2)) * sim.history_step
-            ax2.plot(steps, mean_r2, "b-", label="Sim")
-            ax2.plot(steps, steps, "k--", alpha=0.5, label="Theory")
-            ax2.set_title("MSD")
-            ax2.legend()
-
-            ax3 = self.fig.add_subplot(2, 1, 2)
-            ax3.plot(r_centers, density, "o-", color="purple", lw=2)
-            ax3.fill_between(r_centers, density, alpha=0.3, color="purple")
-            ax3.set_title("Концентрация C(r)")
-            ax3.grid(True)
-
-            self.fig.tight_layout()
-            self.canvas.draw()
+            self.txt_results.config(state="normal")
+            self.txt_results.delete(1.0, tk.END)
+            self.log_result(f"--- АРХИВ: {filename} ---")
+            self.display_results(sim, geo)
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось открыть архив:\n{e}")
 
+    def save_archive(self):
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".traj", filetypes=[("Trajectory Archive", "*.traj")]
+        )
+        if not filename:
+            return
+        try:
+            TrajectoryArchiveWriter.save_history(self.current_sim, filename)
+            messagebox.showinfo("Ок", f"Сохранено: {filename}")
         except Exception as e:
             messagebox.showerror("Ошибка", str(e))
 
@@ -356,7 +633,7 @@ class ScientificApp(tk.Tk):
                 sim.geo_strategy.draw(ax, (-limit, limit), (-limit, limit))
             colors = plt.cm.rainbow(np.linspace(0, 1, 100))
             hx, hy = np.array(sim.history_x), np.array(sim.history_y)
-            for i in range(min(100, sim.num_trajectories)):
+            for i in range(min(100, hx.shape[1])):
                 ax.plot(hx[:, i], hy[:, i], lw=0.8, alpha=0.6, color=colors[i])
             ax.set_title(
                 f"Траектории (τ = {self.current_analytics_data['tortuosity']:.3f})"
@@ -368,9 +645,7 @@ class ScientificApp(tk.Tk):
     def save_diffusion_plot(self):
         def draw(ax):
             sim = self.current_sim
-            X, Y = np.array(sim.history_x), np.array(sim.history_y)
-            mean_r2 = np.mean((X - X[0]) ** 2 + (Y - Y[0]) ** 2, axis=1)
-            steps = np.arange(len(mean_r2)) * sim.history_step
+            steps, mean_r2 = PhysicsAnalyzer.calculate_msd(sim)
             ax.plot(steps, mean_r2, "b-", lw=2)
             ax.plot(steps, steps, "k--", alpha=0.5)
             ax.set_title("MSD")
@@ -387,6 +662,17 @@ class ScientificApp(tk.Tk):
 
         self._save_plot_helper(draw, "concentration_plot")
 
+    def save_density_plot(self):
+        def draw(ax):
+            field = self.current_analytics_data["field"]
+            image = SimulationPlotter.draw_density_field(
+                ax, field, self.current_sim.geo_strategy
+            )
+            ax.figure.colorbar(image, ax=ax, label="Particles / Area")
+            ax.set_title("Карта концентрации")
+
+        self._save_plot_helper(draw, "density_map")
+
 
 if __name__ == "__main__":
     app = ScientificApp()
@@ -0,0 +1,440 @@
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+from simulation import SnapshotObserver
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Параметры задания, которые задаются атрибутами движка, а не конструктором
+RUN_OPTIONS = (
+    "history_step",
+    "seed",
+    "adaptive_miss",
+    "chunk_size",
+    "num_threads",
+    "tracers",
+    "counter_rng",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    config TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    heartbeat REAL,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    runtime REAL,
+    result TEXT,
+    error TEXT
+)
+"""
+
+
+class JobQueue:
+    """
+    Очередь заданий в локальном файле SQLite (переживает перезапуск).
+
+    Задание — словарь config для SimulationEngine (num_trajectories,
+    num_steps, movement_type, geometry_type и их kwargs) плюс атрибуты
+    запуска из RUN_OPTIONS, save_archive и лимиты планировщика memory_budget
+    (байты) и max_runtime (секунды). Статусы: queued -> running ->
+    done / failed. Упавшее задание возвращается в очередь, пока число
+    попыток меньше max_attempts. Задания процесса, который умер, не
+    сообщив результат, находятся по устаревшему heartbeat.
+
+    Каждый процесс открывает свое соединение; захват задания идет в
+    транзакции BEGIN IMMEDIATE, поэтому задание получает один работник.
+    """
+
+    def __init__(self, path="jobs.sqlite", timeout=30.0):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, config, name=None, max_attempts=3):
+        """Ставит задание в очередь, возвращает его id."""
+        cur = self.conn.execute(
+            "INSERT INTO jobs (name, config, status, max_attempts, submitted)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (name, json.dumps(config), QUEUED, max_attempts, time.time()),
+        )
+        return cur.lastrowid
+
+    def claim(self, worker):
+        """Забирает самое старое задание из очереди; None — очередь пуста."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            now = time.time()
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1,"
+                " started = ?, heartbeat = ?, finished = NULL WHERE id = ?",
+                (RUNNING, worker, now, now, row["id"]),
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return self.get(row["id"])
+
+    def heartbeat(self, job_id):
+        self.conn.execute(
+            "UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time(), job_id)
+        )
+
+    def _owned(self, job_id, worker):
+        """Условие: задание выполняется, и (если задан worker) этим работником."""
+        query = " WHERE id = ? AND status = ?"
+        params = [job_id, RUNNING]
+        if worker is not None:
+            query += " AND worker = ?"
+            params.append(worker)
+        return query, params
+
+    def complete(self, job_id, result, worker=None):
+        """
+        Записывает результат. Если задан worker, а задание уже отдано другому
+        работнику (устаревший heartbeat), ничего не меняет и возвращает False.
+        """
+        now = time.time()
+        where, params = self._owned(job_id, worker)
+        cur = self.conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, finished = ?,"
+            " runtime = ? - started" + where,
+            [DONE, json.dumps(result), now, now] + params,
+        )
+        return cur.rowcount > 0
+
+    def fail(self, job_id, error, retry=True, worker=None):
+        """
+        Записывает ошибку; задание возвращается в очередь, если retry и
+        попытки не исчерпаны. Возвращает новый статус; None — задание уже
+        не выполняется этим работником (worker) и не изменено.
+        """
+        job = self.get(job_id)
+        status = QUEUED if retry and job["attempts"] < job["max_attempts"] else FAILED
+        now = time.time()
+        where, params = self._owned(job_id, worker)
+        cur = self.conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished = ?,"
+            " runtime = ? - started" + where,
+            [status, error, now, now] + params,
+        )
+        return status if cur.rowcount else None
+
+    def requeue_stale(self, timeout=None, worker=None):
+        """
+        Возвращает в очередь задания упавших работников: с heartbeat старше
+        timeout секунд или захваченные работником worker. Возвращает их id.
+        """
+        query = "SELECT id FROM jobs WHERE status = ?"
+        params = [RUNNING]
+        if worker is not None:
+            query += " AND worker = ?"
+            params.append(worker)
+        if timeout is not None:
+            query += " AND heartbeat < ?"
+            params.append(time.time() - timeout)
+        stale = [row["id"] for row in self.conn.execute(query, params)]
+        for job_id in stale:
+            self.fail(job_id, "worker crashed")
+        return stale
+
+    def release(self, worker):
+        """Возвращает задания работника в очередь, не засчитывая попытку."""
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts - 1"
+            " WHERE status = ? AND worker = ?",
+            (QUEUED, RUNNING, worker),
+        )
+
+    def get(self, job_id):
+        row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else self._decode(row)
+
+    def jobs(self, status=None):
+        if status is None:
+            rows = self.conn.execute("SELECT * FROM jobs ORDER BY id")
+        else:
+            rows = self.conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY id", (status,)
+            )
+        return [self._decode(row) for row in rows]
+
+    def counts(self):
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        return {status: count for status, count in rows}
+
+    @staticmethod
+    def _decode(row):
+        job = dict(row)
+        job["config"] = json.loads(job["config"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+class _Heartbeat(SnapshotObserver):
+    """
+    Обновляет heartbeat задания каждые interval секунд из фонового потока,
+    независимо от контрольных точек (большой history_step, длинные блоки
+    chunked и adaptive режимов). Поток открывает свое соединение SQLite.
+    """
+
+    def __init__(self, queue_path, job_id, interval=5.0):
+        self.queue_path = queue_path
+        self.job_id = job_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def on_start(self, sim):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._beat, daemon=True)
+        self._thread.start()
+
+    def on_finish(self, sim):
+        self.stop()
+
+    def on_abort(self, sim):
+        self.stop()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _beat(self):
+        with JobQueue(self.queue_path) as queue:
+            while not self._stop.wait(self.interval):
+                queue.heartbeat(self.job_id)
+
+
+def run_job(config, results_dir=".", job_id=None, observers=(), memory_budget=None):
+    """
+    Выполняет одно задание: план памяти, прогон SimulationEngine, аналитика.
+    Возвращает словарь результатов (D_eff, R^2, tau, путь к архиву).
+    Невыполнимый план — ValueError.
+
+    memory_budget — бюджет памяти работника, если в задании он не задан;
+    None — вся доступная память машины.
+    """
+    from analytics import PhysicsAnalyzer
+    from planner import RunPlanner
+    from simulation import SimulationEngine
+
+    config = dict(config)
+    options = {key: config.pop(key) for key in RUN_OPTIONS if key in config}
+    save_archive = config.pop("save_archive", False)
+    budget = config.pop("memory_budget", None) or memory_budget
+    max_runtime = config.pop("max_runtime", None)
+
+    sim = SimulationEngine(**config)
+    for key, value in options.items():
+        setattr(sim, key, value)
+
+    planner = RunPlanner(
+        memory_budget=budget, max_runtime=max_runtime, archive_dir=results_dir
+    )
+    plan = planner.plan(sim)
+    if not plan.feasible:
+        raise ValueError(f"Run plan is not feasible: {plan.reason}")
+    name = f"job_{job_id}.traj" if job_id is not None else "job.traj"
+    archive_path = os.path.join(results_dir, name)
+    writer = plan.apply(sim, archive_path=archive_path)
+    if writer is None and save_archive:
+        from archive import TrajectoryArchiveWriter
+
+        sim.keep_history = False
+        writer = sim.add_observer(TrajectoryArchiveWriter(archive_path))
+    for observer in observers:
+        sim.add_observer(observer)
+
+    sim.run()
+
+    result = {"plan_changes": plan.changes}
+    if sim.counter_rng:
+        # Ключ генератора: траектории восстанавливаются через replay
+        result["seed"] = sim.seed
+    if writer is not None:
+        from archive import TrajectoryArchive
+
+        result["archive"] = os.path.abspath(archive_path)
+        with TrajectoryArchive(archive_path) as archive:
+            stride = -(-archive.num_particles // plan.analysis_particles)
+            sim = archive.to_sim(particles=slice(0, None, stride))
+
+    slope, r2 = PhysicsAnalyzer.calculate_diffusion_coefficient(sim)
+    result.update(
+        {"d_eff": slope, "r2": r2, "tortuosity": 1.0 / slope if slope else None}
+    )
+    return result
+
+
+class JobWorker:
+    """
+    Работник: забирает задания из очереди и выполняет их по одному.
+    memory_budget — бюджет памяти заданий без собственного memory_budget.
+    """
+
+    def __init__(
+        self, queue_path, results_dir=".", name=None, heartbeat=5.0, memory_budget=None
+    ):
+        self.queue = JobQueue(queue_path)
+        self.results_dir = results_dir
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.heartbeat = heartbeat
+        self.memory_budget = memory_budget
+
+    def run_once(self):
+        """Выполняет одно задание; False — очередь пуста."""
+        job = self.queue.claim(self.name)
+        if job is None:
+            return False
+        heartbeat = _Heartbeat(self.queue.path, job["id"], self.heartbeat)
+        try:
+            result = run_job(
+                job["config"],
+                self.results_dir,
+                job["id"],
+                observers=[heartbeat],
+                memory_budget=self.memory_budget,
+            )
+        except Exception:
+            done = self.queue.fail(job["id"], traceback.format_exc(), worker=self.name)
+        else:
+            done = self.queue.complete(job["id"], result, worker=self.name)
+        finally:
+            heartbeat.stop()
+        if not done:
+            print(f"Job {job['id']} was reassigned to another worker; result dropped")
+        return True
+
+    def run(self, poll_interval=2.0, stop_when_empty=False):
+        while True:
+            if not self.run_once():
+                if stop_when_empty:
+                    return
+                time.sleep(poll_interval)
+
+
+def _worker_main(
+    queue_path, results_dir, name, poll_interval, stop_when_empty, memory_budget
+):
+    worker = JobWorker(queue_path, results_dir, name, memory_budget=memory_budget)
+    worker.run(poll_interval, stop_when_empty)
+
+
+class JobWorkerPool:
+    """
+    Демон с пулом процессов-работников. Процесс, завершившийся с ошибкой
+    (падение интерпретатора, нехватка памяти), перезапускается, а его
+    задание сразу возвращается в очередь. Задания с heartbeat старше
+    stale_timeout (например, после перезапуска машины) тоже.
+
+    Работники идут одновременно, поэтому каждый планирует задания в своей
+    доле памяти: memory_budget (байты на работника), по умолчанию —
+    доступная память / num_workers.
+    """
+
+    def __init__(
+        self,
+        queue_path="jobs.sqlite",
+        num_workers=None,
+        results_dir=".",
+        poll_interval=2.0,
+        stale_timeout=600.0,
+        memory_budget=None,
+    ):
+        self.queue_path = queue_path
+        self.num_workers = num_workers or os.cpu_count()
+        self.results_dir = results_dir
+        self.poll_interval = poll_interval
+        self.stale_timeout = stale_timeout
+        self.memory_budget = memory_budget
+        self._budget = None
+
+    def worker_budget(self):
+        """Бюджет памяти одного работника (None — неизвестен)."""
+        if self.memory_budget is not None:
+            return self.memory_budget
+        from planner import available_memory
+
+        total = available_memory()
+        return None if total is None else total // self.num_workers
+
+    def _start(self, index, stop_when_empty):
+        name = f"{socket.gethostname()}:pool{os.getpid()}-{index}"
+        process = multiprocessing.Process(
+            target=_worker_main,
+            args=(
+                self.queue_path,
+                self.results_dir,
+                name,
+                self.poll_interval,
+                stop_when_empty,
+                self._budget,
+            ),
+            daemon=True,
+        )
+        process.start()
+        return name, process
+
+    def run(self, stop_when_empty=False):
+        """Работает до Ctrl+C (или до опустошения очереди)."""
+        os.makedirs(self.results_dir, exist_ok=True)
+        self._budget = self.worker_budget()
+        with JobQueue(self.queue_path) as queue:
+            queue.requeue_stale(self.stale_timeout)
+            workers = [self._start(i, stop_when_empty) for i in range(self.num_workers)]
+            try:
+                while True:
+                    queue.requeue_stale(self.stale_timeout)
+                    for i, (name, process) in enumerate(workers):
+                        if process.exitcode is None:
+                            continue
+                        crashed = process.exitcode != 0
+                        if crashed:
+                            queue.requeue_stale(worker=name)
+                        if crashed or queue.counts().get(QUEUED):
+                            workers[i] = self._start(i, stop_when_empty)
+                    if stop_when_empty and not any(p.is_alive() for _, p in workers):
+                        return
+                    time.sleep(self.poll_interval)
+            finally:
+                for name, process in workers:
+                    process.terminate()
+                    process.join()
+                    # Прерванные остановкой демона задания — без штрафа
+                    queue.release(name)
@@ -0,0 +1,335 @@
+import argparse
+import json
+import sys
+
+from analytics import PhysicsAnalyzer
+from jobqueue import JobQueue, JobWorkerPool
+from planner import RunPlanner
+from simulation import SimulationEngine
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Particle diffusion simulator (command line)"
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_run_args(p):
+        p.add_argument("--particles", type=int, default=2000)
+        p.add_argument("--steps", type=int, default=1500)
+        p.add_argument("--geometry", default="parallel")
+        p.add_argument("--movement", default="normal")
+        p.add_argument("--barrier-dist", type=float, default=20.0)
+        p.add_argument("--hole-size", type=float, default=8.0)
+        p.add_argument("--history-step", type=int, default=10)
+        p.add_argument(
+            "--porosity",
+            type=float,
+            default=None,
+            help="random geometry: non-overlapping obstacles at this porosity",
+        )
+        p.add_argument("--obstacle-seed", type=int, default=None)
+        p.add_argument(
+            "--obstacles", default=None, help="random geometry: saved medium (.npz)"
+        )
+        p.add_argument(
+            "--collision",
+            choices=("endpoint", "continuous"),
+            default=None,
+            help="random geometry: end-point check or segment reflection",
+        )
+        p.add_argument(
+            "--tracers",
+            type=int,
+            default=None,
+            help="keep full history only for this many particles",
+        )
+        p.add_argument(
+            "--adaptive-miss",
+            type=float,
+            default=None,
+            help="combine far-from-wall steps with this wall-miss probability",
+        )
+        p.add_argument(
+            "--counter-rng",
+            action="store_true",
+            help="counter-based RNG: any particle can be replayed after the run",
+        )
+        p.add_argument(
+            "--memory-budget",
+            type=float,
+            default=None,
+            help="memory budget in GB (default: available memory)",
+        )
+        p.add_argument("--max-runtime", type=float, default=None, help="seconds")
+
+    add_run_args(sub.add_parser("plan", help="estimate memory and runtime"))
+    run = sub.add_parser("run", help="plan and run a simulation")
+    add_run_args(run)
+    run.add_argument(
+        "--archive", default="run.traj", help="archive path for on-disk history"
+    )
+
+    # Очередь заданий (локальный SQLite)
+    submit = sub.add_parser("submit", help="add a simulation job to the queue")
+    add_run_args(submit)
+    submit.add_argument("--queue", default="jobs.sqlite")
+    submit.add_argument("--name", default=None)
+    submit.add_argument("--seed", type=int, default=None)
+    submit.add_argument("--retries", type=int, default=3, help="max attempts")
+    submit.add_argument("--save-archive", action="store_true")
+
+    worker = sub.add_parser("worker", help="run the worker-pool daemon")
+    worker.add_argument("--queue", default="jobs.sqlite")
+    worker.add_argument("--workers", type=int, default=None)
+    worker.add_argument("--results-dir", default="results")
+    worker.add_argument("--poll", type=float, default=2.0, help="seconds")
+    worker.add_argument(
+        "--stale-timeout",
+        type=float,
+        default=600.0,
+        help="requeue running jobs without a heartbeat for this many seconds",
+    )
+    worker.add_argument(
+        "--once", action="store_true", help="exit when the queue is empty"
+    )
+    worker.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        help="memory budget per worker in GB (default: available memory / workers)",
+    )
+
+    jobs = sub.add_parser("jobs", help="list queued and finished jobs")
+    jobs.add_argument("--queue", default="jobs.sqlite")
+    jobs.add_argument("--status", default=None)
+
+    show = sub.add_parser("show", help="show a job's config and results")
+    show.add_argument("job_id", type=int)
+    show.add_argument("--queue", default="jobs.sqlite")
+
+    bench = sub.add_parser(
+        "collisions", help="benchmark end-point vs continuous obstacle collisions"
+    )
+    bench.add_argument("--porosity", type=float, default=0.6)
+    bench.add_argument("--radius", type=float, default=2.0)
+    bench.add_argument("--field-size", type=float, default=60.0)
+    bench.add_argument("--obstacle-seed", type=int, default=None)
+    bench.add_argument("--particles", type=int, default=2000)
+    bench.add_argument(
+        "--duration", type=float, default=25.0, help="physical time in r_obs^2"
+    )
+    bench.add_argument(
+        "--step-scales",
+        type=float,
+        nargs="+",
+        default=[0.25, 0.5, 1.0, 2.0],
+        help="step sigma in units of r_obs",
+    )
+    bench.add_argument("--seed", type=int, default=None)
+    return parser
+
+
+def medium_kwargs(args):
+    """Параметры случайной среды, заданные в командной строке."""
+    kwargs = {}
+    if args.porosity is not None:
+        kwargs["porosity"] = args.porosity
+    if args.obstacle_seed is not None:
+        kwargs["obstacle_seed"] = args.obstacle_seed
+    if args.obstacles is not None:
+        kwargs["obstacles_path"] = args.obstacles
+    if args.collision is not None:
+        kwargs["collision"] = args.collision
+    return kwargs
+
+
+def make_engine(args):
+    sim = SimulationEngine(
+        num_trajectories=args.particles,
+        num_steps=args.steps,
+        movement_type=args.movement,
+        geometry_type=args.geometry,
+        barrier_dist=args.barrier_dist,
+        hole_size=args.hole_size,
+        **medium_kwargs(args),
+    )
+    sim.history_step = args.history_step
+    sim.adaptive_miss = args.adaptive_miss
+    sim.tracers = args.tracers
+    sim.counter_rng = args.counter_rng
+    return sim
+
+
+def make_plan(args, sim):
+    budget = None
+    if args.memory_budget is not None:
+        budget = args.memory_budget * 1024**3
+    planner = RunPlanner(memory_budget=budget, max_runtime=args.max_runtime)
+    plan = planner.plan(sim)
+    print("--- RUN PLAN ---")
+    print(plan.summary())
+    return plan
+
+
+def run(args):
+    sim = make_engine(args)
+    plan = make_plan(args, sim)
+    if not plan.feasible:
+        return 2
+
+    plan.apply(sim, archive_path=args.archive)
+    sim.run()
+    seed = sim.seed
+
+    if plan.on_disk:
+        from archive import TrajectoryArchive
+
+        with TrajectoryArchive(args.archive) as archive:
+            stride = -(-archive.num_particles // plan.analysis_particles)
+            sim = archive.to_sim(particles=slice(0, None, stride))
+
+    slope, r2 = PhysicsAnalyzer.calculate_diffusion_coefficient(sim)
+    print("\n--- ANALYTICS REPORT ---")
+    print(f"Diffusion Slope (D_eff): {slope:.4f}")
+    print(f"Linearity (R^2):         {r2:.4f}")
+    print(f"Tortuosity (τ):          {1.0 / slope:.4f}")
+    if args.counter_rng:
+        print(f"Counter RNG seed:        {seed} (SimulationEngine.replay)")
+
+    if getattr(sim, "moments", None) is not None:
+        tensor = PhysicsAnalyzer.calculate_diffusion_tensor(sim)
+        (dxx, dxy), (_, dyy) = tensor["tensor"]
+        print(f"Diffusion tensor:        Dxx={dxx:.4f} Dyy={dyy:.4f} Dxy={dxy:.4f}")
+        print(
+            f"Principal D:             {tensor['eigenvalues'][0]:.4f} / "
+            f"{tensor['eigenvalues'][1]:.4f} (axis {tensor['angle']:.1f}°)"
+        )
+        print(
+            f"Principal τ:             {tensor['tortuosity'][0]:.4f} / "
+            f"{tensor['tortuosity'][1]:.4f}"
+        )
+        verdict = "diffusive" if tensor["diffusive"] else "NOT diffusive, fit rejected"
+        print(f"max |alpha_2|:           {tensor['alpha2_max']:.4f} ({verdict})")
+    return 0
+
+
+def job_config(args):
+    """Конфигурация задания очереди из аргументов командной строки."""
+    config = {
+        "num_trajectories": args.particles,
+        "num_steps": args.steps,
+        "movement_type": args.movement,
+        "geometry_type": args.geometry,
+        "barrier_dist": args.barrier_dist,
+        "hole_size": args.hole_size,
+        "history_step": args.history_step,
+        "save_archive": args.save_archive,
+        **medium_kwargs(args),
+    }
+    if args.adaptive_miss is not None:
+        config["adaptive_miss"] = args.adaptive_miss
+    if args.tracers is not None:
+        config["tracers"] = args.tracers
+    if args.seed is not None:
+        config["seed"] = args.seed
+    if args.counter_rng:
+        config["counter_rng"] = True
+    if args.memory_budget is not None:
+        config["memory_budget"] = int(args.memory_budget * 1024**3)
+    if args.max_runtime is not None:
+        config["max_runtime"] = args.max_runtime
+    return config
+
+
+def submit(args):
+    with JobQueue(args.queue) as queue:
+        job_id = queue.submit(job_config(args), args.name, args.retries)
+    print(f"Job {job_id} queued in {args.queue}")
+    return 0
+
+
+def list_jobs(args):
+    with JobQueue(args.queue) as queue:
+        jobs = queue.jobs(args.status)
+    print(f"{'id':>5} {'status':8} {'tries':>5} {'runtime':>9} {'D_eff':>8}  name")
+    for job in jobs:
+        runtime = f"{job['runtime']:.1f}s" if job["runtime"] is not None else "-"
+        d_eff = f"{job['result']['d_eff']:.4f}" if job["result"] else "-"
+        print(
+            f"{job['id']:>5} {job['status']:8} "
+            f"{job['attempts']:>2}/{job['max_attempts']:<2} "
+            f"{runtime:>9} {d_eff:>8}  {job['name'] or ''}"
+        )
+    return 0
+
+
+def show_job(args):
+    with JobQueue(args.queue) as queue:
+        job = queue.get(args.job_id)
+    if job is None:
+        print(f"No job {args.job_id} in {args.queue}")
+        return 1
+    print(json.dumps(job, indent=2, ensure_ascii=False))
+    return 0
+
+
+def benchmark_collisions(args):
+    from comparison import CollisionBenchmark
+    from geometry import RandomObstaclesGeometry
+
+    geo = RandomObstaclesGeometry.packed(
+        args.porosity,
+        obstacle_radius=args.radius,
+        field_size=args.field_size,
+        seed=args.obstacle_seed,
+    )
+    print(f"{geo.num_obstacles} obstacles, porosity {geo.porosity:.3f}")
+    bench = CollisionBenchmark(
+        geo,
+        step_scales=args.step_scales,
+        num_trajectories=args.particles,
+        duration=args.duration,
+        seed=args.seed,
+    )
+    bench.run()
+    print(bench.report())
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "plan":
+        sim = make_engine(args)
+        return 0 if make_plan(args, sim).feasible else 2
+    if args.command == "submit":
+        return submit(args)
+    if args.command == "worker":
+        pool = JobWorkerPool(
+            args.queue,
+            num_workers=args.workers,
+            results_dir=args.results_dir,
+            poll_interval=args.poll,
+            stale_timeout=args.stale_timeout,
+            memory_budget=(
+                None
+                if args.memory_budget is None
+                else int(args.memory_budget * 1024**3)
+            ),
+        )
+        try:
+            pool.run(stop_when_empty=args.once)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if args.command == "jobs":
+        return list_jobs(args)
+    if args.command == "show":
+        return show_job(args)
+    if args.command == "collisions":
+        return benchmark_collisions(args)
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+import numpy as np
+
+from simulation import SnapshotObserver
+
+# --- СТОКИ (Поглощающие границы) ---
+
+
+class PlaneSink:
+    """
+    Поглощающая плоскость: частица удаляется, если координата axis
+    достигла level (side="above": >= level, "below": <= level).
+    """
+
+    def __init__(self, level, axis="y", side="above"):
+        self.level = level
+        self.axis = axis
+        self.side = side
+
+    def absorbs(self, x, y):
+        coord = y if self.axis == "y" else x
+        if self.side == "above":
+            return coord >= self.level
+        return coord <= self.level
+
+    def __repr__(self):
+        sign = ">=" if self.side == "above" else "<="
+        return f"{self.axis}{sign}{self.level:g}"
+
+
+class RadialSink:
+    """Поглощающая окружность: частица удаляется при r >= radius."""
+
+    def __init__(self, radius):
+        self.radius = radius
+
+    def absorbs(self, x, y):
+        return x**2 + y**2 >= self.radius**2
+
+    def __repr__(self):
+        return f"r>={self.radius:g}"
+
+
+# --- ИСТОЧНИКИ (Инжекция частиц) ---
+
+
+class LineSource:
+    """
+    Источник на линии axis = level: rate частиц за шаг (дробная часть
+    накапливается), равномерно по отрезку span другой координаты.
+    """
+
+    def __init__(self, rate, level=0.0, axis="y", span=(-50.0, 50.0)):
+        self.rate = rate
+        self.level = level
+        self.axis = axis
+        self.span = span
+        self._carry = 0.0
+
+    def emit(self, rng):
+        self._carry += self.rate
+        count = int(self._carry)
+        self._carry -= count
+        along = rng.uniform(self.span[0], self.span[1], count)
+        across = np.full(count, float(self.level))
+        if self.axis == "y":
+            return along, across
+        return across, along
+
+
+class PointSource:
+    """Точечный источник: rate частиц за шаг в точке (x, y)."""
+
+    def __init__(self, rate, x=0.0, y=0.0):
+        self.rate = rate
+        self.x = x
+        self.y = y
+        self._carry = 0.0
+
+    def emit(self, rng):
+        self._carry += self.rate
+        count = int(self._carry)
+        self._carry -= count
+        return np.full(count, float(self.x)), np.full(count, float(self.y))
+
+
+# --- ЯЧЕЙКА ПРОНИЦАЕМОСТИ ---
+
+
+class PermeationCell(SnapshotObserver):
+    """
+    Стоки, источники и счетчики потоков для любой GeometryStrategy.
+
+    После каждого шага частицы, попавшие в сток, помечаются поглощенными
+    (их места становятся свободными) и учитываются в потоке. Источники
+    занимают свободные места; если их не хватает, массивы движка растут
+    с запасом свободных мест. Массивы уплотняются (свободные места
+    удаляются), только когда их доля превышает compact_threshold, поэтому
+    мертвые частицы тратят не больше этой доли времени. sim.num_trajectories
+    — длина массивов вместе со свободными местами, число активных частиц —
+    в active.
+
+    wrap_x=(x0, width) — периодичность по x (ширина должна быть кратна
+    периоду геометрии, для ParallelLinesGeometry — 4 * hole_size).
+    profile=(axis, lo, hi, bins) — профиль концентрации вдоль axis,
+    усредняемый по контрольным точкам с шагом >= steady_from.
+
+    Число и порядок частиц меняются, поэтому история в памяти и блочный
+    и адаптивный режимы не поддерживаются (sim.keep_history должен быть False),
+    а потоковые моменты смещений отключаются (sim.stream_moments).
+    """
+
+    def __init__(
+        self,
+        sinks,
+        sources=(),
+        compact_threshold=0.1,
+        wrap_x=None,
+        profile=None,
+        steady_from=0,
+        seed=None,
+    ):
+        if not isinstance(sinks, dict):
+            sinks = {repr(s): s for s in sinks}
+        self.sinks = sinks
+        self.sources = list(sources)
+        self.compact_threshold = compact_threshold
+        self.wrap_x = wrap_x
+        self.profile = profile
+        self.steady_from = steady_from
+        self.rng = np.random.default_rng(seed)
+
+        self.absorbed = {}
+        self.injected = None
+        self.active = None
+        self.profile_counts = None
+        self.profile_snapshots = 0
+        self.compactions = 0
+        self._alive = None
+
+    def on_start(self, sim):
+        if sim.keep_history or sim.tracers is not None:
+            raise ValueError("PermeationCell requires sim.keep_history = False")
+        if sim.chunk_size or sim.adaptive_miss:
+            raise ValueError("PermeationCell requires the serial per-step mode")
+        sim.stream_moments = False
+
+        self.absorbed = {
+            name: np.zeros(sim.num_steps + 1, dtype=np.int64) for name in self.sinks
+        }
+        self.injected = np.zeros(sim.num_steps + 1, dtype=np.int64)
+        self.active = np.zeros(sim.num_steps + 1, dtype=np.int64)
+        self.active[0] = sim.num_trajectories
+        if self.profile is not None:
+            self.profile_counts = np.zeros(self.profile[3], dtype=np.int64)
+        self.profile_snapshots = 0
+        self.compactions = 0
+        self._alive = np.ones(sim.num_trajectories, dtype=bool)
+
+    def on_step(self, sim, step):
+        x, y = sim.x, sim.y
+        if self.wrap_x is not None:
+            x0, width = self.wrap_x
+            x = x0 + np.mod(x - x0, width)
+            sim.x = x
+
+        for name, sink in self.sinks.items():
+            hit = self._alive & sink.absorbs(x, y)
+            count = np.count_nonzero(hit)
+            if count:
+                self.absorbed[name][step] = count
+                self._alive &= ~hit
+
+        new_x, new_y = [], []
+        for source in self.sources:
+            sx, sy = source.emit(self.rng)
+            new_x.append(sx)
+            new_y.append(sy)
+        num_new = sum(len(sx) for sx in new_x)
+        self.injected[step] = num_new
+
+        if num_new:
+            self._inject(sim, np.concatenate(new_x), np.concatenate(new_y))
+
+        dead = len(sim.x) - np.count_nonzero(self._alive)
+        if dead > self.compact_threshold * max(len(sim.x), 1):
+            self._compact(sim)
+
+        self.active[step] = np.count_nonzero(self._alive)
+
+    def _inject(self, sim, new_x, new_y):
+        """Размещает новые частицы в свободных местах, при нехватке — растит."""
+        free = np.flatnonzero(~self._alive)
+        missing = len(new_x) - len(free)
+        if missing > 0:
+            # Запас свободных мест (половина порога уплотнения) для следующих
+            # инжекций, чтобы массивы не перевыделялись на каждом шаге
+            spare = int(0.5 * self.compact_threshold * (len(sim.x) + missing))
+            grow = missing + spare
+            sim.x = np.concatenate([sim.x, np.zeros(grow)])
+            sim.y = np.concatenate([sim.y, np.zeros(grow)])
+            self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+            sim.num_trajectories = len(sim.x)
+            free = np.flatnonzero(~self._alive)
+        slots = free[: len(new_x)]
+        sim.x[slots] = new_x
+        sim.y[slots] = new_y
+        self._alive[slots] = True
+
+    def _compact(self, sim):
+        sim.x = sim.x[self._alive]
+        sim.y = sim.y[self._alive]
+        sim.num_trajectories = len(sim.x)
+        self._alive = np.ones(sim.num_trajectories, dtype=bool)
+        self.compactions += 1
+
+    def on_snapshot(self, sim, step):
+        if self.profile is None or step < self.steady_from:
+            return
+        axis, lo, hi, bins = self.profile
+        coord = sim.y if axis == "y" else sim.x
+        coord = coord[self._alive]
+        idx = np.floor((coord - lo) * (bins / (hi - lo))).astype(np.intp)
+        idx = idx[(idx >= 0) & (idx < bins)]
+        self.profile_counts += np.bincount(idx, minlength=bins)
+        self.profile_snapshots += 1
+
+    @property
+    def alive(self):
+        """Маска активных частиц в массивах движка (False — свободное место)."""
+        return self._alive
+
+    @property
+    def profile_edges(self):
+        _, lo, hi, bins = self.profile
+        return np.linspace(lo, hi, bins + 1)
@@ -0,0 +1,217 @@
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from types import SimpleNamespace
+
+import numpy as np
+
+from simulation import SnapshotObserver
+
+# --- АНАЛИЗАТОРЫ СНИМКОВ (Strategy) ---
+
+
+class SnapshotAnalyzer(ABC):
+    """
+    Анализ одного снимка координат в рабочем потоке конвейера.
+
+    start(sim) вызывается в основном потоке до расчета; analyze(step, x, y)
+    — в рабочих потоках, снимки приходят в произвольном порядке, поэтому
+    analyze не должен менять общее состояние, а только возвращать значение.
+    reduce(steps, values) собирает итог по снимкам, упорядоченным по шагу.
+
+    steps — какие снимки анализировать: None — все контрольные точки,
+    набор шагов — только они (остальные снимки не копируются).
+    """
+
+    name = None
+    steps = None
+
+    def wants(self, step):
+        return self.steps is None or step in self.steps
+
+    def start(self, sim):
+        pass
+
+    @abstractmethod
+    def analyze(self, step, x, y):
+        pass
+
+    def reduce(self, steps, values):
+        return np.asarray(steps), values
+
+
+class MSDAnalyzer(SnapshotAnalyzer):
+    """Средний квадрат смещения от начальных координат: (steps, mean_r2)."""
+
+    name = "msd"
+
+    def start(self, sim):
+        self._x0 = np.array(sim.x, dtype=float)
+        self._y0 = np.array(sim.y, dtype=float)
+
+    def analyze(self, step, x, y):
+        return float(np.mean((x - self._x0) ** 2 + (y - self._y0) ** 2))
+
+    def reduce(self, steps, values):
+        return np.asarray(steps), np.asarray(values)
+
+
+class RadialProfileAnalyzer(SnapshotAnalyzer):
+    """
+    Радиальный профиль концентрации C(r) в каждом снимке (как
+    PhysicsAnalyzer.calculate_radial_concentration): (steps, profiles),
+    profiles[i] = (centers, counts, density).
+    """
+
+    name = "radial"
+
+    def __init__(self, dr=5.0, steps=None):
+        self.dr = dr
+        self.steps = steps
+
+    def analyze(self, step, x, y):
+        from analytics import PhysicsAnalyzer
+
+        snapshot = SimpleNamespace(x=x, y=y)
+        return PhysicsAnalyzer.calculate_radial_concentration(snapshot, dr=self.dr)
+
+
+class _FunctionAnalyzer(SnapshotAnalyzer):
+    """Обертка для пользовательской функции func(step, x, y)."""
+
+    def __init__(self, func, name):
+        self.func = func
+        self.name = name
+
+    def analyze(self, step, x, y):
+        return self.func(step, x, y)
+
+
+# --- КОНВЕЙЕР (Producer-Consumer) ---
+
+
+class AnalyticsPipeline(SnapshotObserver):
+    """
+    Аналитика во время расчета: движок (производитель) кладет копию
+    координат каждой контрольной точки в ограниченную очередь, рабочие
+    потоки (потребители) прогоняют снимок через все анализаторы, пока
+    симуляция идет дальше. NumPy отпускает GIL на больших массивах,
+    поэтому анализ перекрывается с шагами движка.
+
+    Очередь вмещает max_pending снимков: если анализ не успевает, движок
+    ждет в on_snapshot (обратное давление), и в памяти одновременно не
+    больше max_pending + num_workers + 1 копий координат. Время ожидания
+    копится в stall_time.
+
+    После расчета results[name] — итог reduce каждого анализатора.
+    Ошибка анализатора прерывает расчет в ближайшей контрольной точке.
+    Число частиц должно быть постоянным (не для PermeationCell).
+    """
+
+    def __init__(self, analyzers=(), num_workers=2, max_pending=4):
+        self.analyzers = []
+        for analyzer in analyzers:
+            self.register(analyzer)
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+
+        self.results = {}
+        self.stall_time = 0.0
+        self.max_in_flight = 0
+        self._queue = None
+        self._threads = []
+        self._values = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._error = None
+
+    def register(self, analyzer, name=None):
+        """
+        Добавляет анализатор (SnapshotAnalyzer или функцию
+        func(step, x, y)) и возвращает его.
+        """
+        if not isinstance(analyzer, SnapshotAnalyzer):
+            analyzer = _FunctionAnalyzer(analyzer, name or analyzer.__name__)
+        elif name is not None:
+            analyzer.name = name
+        elif analyzer.name is None:
+            analyzer.name = type(analyzer).__name__
+        if any(a.name == analyzer.name for a in self.analyzers):
+            raise ValueError(f"Analyzer '{analyzer.name}' is already registered")
+        self.analyzers.append(analyzer)
+        return analyzer
+
+    def on_start(self, sim):
+        for analyzer in self.analyzers:
+            analyzer.start(sim)
+        self.results = {}
+        self.stall_time = 0.0
+        self.max_in_flight = 0
+        self._values = {analyzer.name: [] for analyzer in self.analyzers}
+        self._in_flight = 0
+        self._error = None
+
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._threads = [
+            threading.Thread(target=self._worker, daemon=True)
+            for _ in range(self.num_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def on_snapshot(self, sim, step):
+        if self._error is not None:
+            self._shutdown()
+            raise RuntimeError("Analytics pipeline failed") from self._error
+        if not any(analyzer.wants(step) for analyzer in self.analyzers):
+            return
+        # Копия: движок меняет координаты на месте
+        item = (step, np.array(sim.x, copy=True), np.array(sim.y, copy=True))
+        with self._lock:
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        started = time.perf_counter()
+        self._queue.put(item)
+        self.stall_time += time.perf_counter() - started
+
+    def on_finish(self, sim):
+        self._shutdown()
+        if self._error is not None:
+            raise RuntimeError("Analytics pipeline failed") from self._error
+        for analyzer in self.analyzers:
+            pairs = sorted(self._values[analyzer.name], key=lambda pair: pair[0])
+            steps = [step for step, _ in pairs]
+            values = [value for _, value in pairs]
+            self.results[analyzer.name] = analyzer.reduce(steps, values)
+
+    def on_abort(self, sim):
+        self._shutdown()
+
+    def _shutdown(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            step, x, y = item
+            # После ошибки очередь только опустошается, чтобы движок не завис
+            if self._error is None:
+                try:
+                    for analyzer in self.analyzers:
+                        if not analyzer.wants(step):
+                            continue
+                        value = analyzer.analyze(step, x, y)
+                        with self._lock:
+                            self._values[analyzer.name].append((step, value))
+                except BaseException as e:
+                    # Любая ошибка, иначе поток умрет и движок зависнет в put
+                    self._error = e
+            with self._lock:
+                self._in_flight -= 1
@@ -0,0 +1,302 @@
+import os
+import shutil
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def format_bytes(num):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(num) < 1024:
+            return f"{num:.1f} {unit}"
+        num /= 1024
+    return f"{num:.1f} TB"
+
+
+def available_memory():
+    """Доступная память (MemAvailable в Linux), None — если неизвестно."""
+    try:
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class RunPlan:
+    """
+    План запуска: оценки памяти и времени и выбранные настройки хранения
+    истории (history_step, history_dtype, запись на диск).
+    """
+
+    def __init__(self, num_trajectories, num_steps, history_particles=None):
+        self.num_trajectories = num_trajectories
+        self.num_steps = num_steps
+        # Частицы с историей (меньше num_trajectories при трассерах)
+        self.history_particles = (
+            num_trajectories if history_particles is None else history_particles
+        )
+
+        self.history_step = None
+        self.history_dtype = np.float64
+        self.on_disk = False
+        self.chunk_snapshots = 16
+        self.analysis_particles = num_trajectories
+
+        self.state_bytes = 0
+        self.temp_bytes = 0
+        self.history_bytes = 0
+        self.analysis_bytes = 0
+        self.archive_bytes = 0
+        self.peak_bytes = 0
+        self.memory_budget = None
+        self.runtime = 0.0
+
+        self.feasible = True
+        self.reason = ""
+        self.changes = []
+
+    def apply(self, sim, archive_path=None):
+        """
+        Переносит настройки хранения в движок. Для записи на диск подключает
+        TrajectoryArchiveWriter и возвращает его.
+        """
+        if not self.feasible:
+            raise ValueError(f"Run plan is not feasible: {self.reason}")
+        sim.history_step = self.history_step
+        sim.history_dtype = self.history_dtype
+        if not self.on_disk:
+            return None
+
+        from archive import TrajectoryArchiveWriter
+
+        if archive_path is None:
+            raise ValueError("archive_path is required for on-disk history")
+        sim.keep_history = False
+        return sim.add_observer(
+            TrajectoryArchiveWriter(archive_path, chunk_snapshots=self.chunk_snapshots)
+        )
+
+    def summary(self):
+        lines = [
+            f"Particles x steps:  {self.num_trajectories} x {self.num_steps}",
+            f"History particles:  {self.history_particles}",
+            f"State + temporaries: {format_bytes(self.state_bytes + self.temp_bytes)}",
+            f"History:            {format_bytes(self.history_bytes)}"
+            f" (step {self.history_step}, {np.dtype(self.history_dtype).name}"
+            f"{', on disk, in-memory buffer' if self.on_disk else ''})",
+            f"Analysis:           {format_bytes(self.analysis_bytes)}",
+            f"Peak memory:        {format_bytes(self.peak_bytes)}",
+        ]
+        if self.memory_budget is not None:
+            lines.append(f"Memory budget:      {format_bytes(self.memory_budget)}")
+        if self.on_disk:
+            lines.append(f"Archive on disk:    ~{format_bytes(self.archive_bytes)}")
+            lines.append(f"Analysis particles: {self.analysis_particles}")
+        lines.append(f"Expected runtime:   {self.runtime:.1f} s")
+        for change in self.changes:
+            lines.append(f"* {change}")
+        if not self.feasible:
+            lines.append(f"IMPOSSIBLE: {self.reason}")
+        return "\n".join(lines)
+
+
+class RunPlanner:
+    """
+    Планировщик запуска SimulationEngine до старта расчета.
+
+    Короткий калибровочный прогон на тех же стратегиях движения и геометрии
+    измеряет время на частице-шаг и пиковые временные массивы на частицу
+    (tracemalloc). По ним оцениваются пик памяти (состояние, временные
+    массивы шага, история с учетом history_step, анализ) и время расчета.
+    Если план не укладывается в memory_budget, по очереди пробуются:
+    история в float32, более редкие снимки (не меньше MIN_SNAPSHOTS),
+    история на диске с анализом по подвыборке частиц.
+    """
+
+    # PhysicsAnalyzer копирует историю в массивы и считает R^2
+    ANALYSIS_FACTOR = 2.0
+    MIN_SNAPSHOTS = 20
+    MIN_ANALYSIS_PARTICLES = 100
+    # Типичная степень сжатия архива траекторий
+    ARCHIVE_RATIO = 0.4
+
+    def __init__(
+        self,
+        memory_budget=None,
+        max_runtime=None,
+        calibration_particles=10000,
+        calibration_steps=20,
+        archive_dir=".",
+    ):
+        self.memory_budget = memory_budget
+        self.max_runtime = max_runtime
+        self.calibration_particles = calibration_particles
+        self.calibration_steps = calibration_steps
+        self.archive_dir = archive_dir
+
+    def calibrate(self, sim):
+        """
+        Возвращает (секунд на частице-шаг, байт временных массивов на частицу).
+        Частицы калибровки разбросаны как в середине прогона, чтобы доля
+        пересечений барьеров была типичной. Случайные числа берутся из
+        собственного генератора: глобальное состояние np.random (и значит
+        воспроизводимость прогона без seed) калибровка не меняет.
+        """
+        n = max(1, min(self.calibration_particles, sim.num_trajectories))
+        spread = np.sqrt(max(sim.num_steps, 1) / 2.0)
+        rng = np.random.default_rng(0)
+        x = rng.normal(0.0, spread, n)
+        y = rng.normal(0.0, spread, n)
+
+        def step(x, y):
+            dx, dy = sim.move_strategy.get_displacement(n, rng=rng)
+            return sim.geo_strategy.apply_boundaries(x, y, x + dx, y + dy)
+
+        # Прогрев и пик памяти одного шага
+        tracemalloc.start()
+        try:
+            base, _ = tracemalloc.get_traced_memory()
+            x, y = step(x, y)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        temp_per_particle = max(peak - base, 0) / n
+
+        start = time.perf_counter()
+        for _ in range(self.calibration_steps):
+            x, y = step(x, y)
+        elapsed = time.perf_counter() - start
+
+        return elapsed / (n * self.calibration_steps), temp_per_particle
+
+    def _history_bytes(self, plan, stride, dtype, particles=None):
+        particles = plan.history_particles if particles is None else particles
+        snapshots = plan.num_steps // stride + 1
+        return snapshots * particles * 2 * np.dtype(dtype).itemsize
+
+    def _fill(self, plan, stride, dtype):
+        plan.history_step = stride
+        plan.history_dtype = dtype
+        plan.history_bytes = self._history_bytes(plan, stride, dtype)
+        plan.analysis_bytes = self.ANALYSIS_FACTOR * plan.history_bytes
+        plan.peak_bytes = (
+            plan.state_bytes
+            + plan.history_bytes
+            + max(plan.temp_bytes, plan.analysis_bytes)
+        )
+
+    def plan(self, sim):
+        n, steps = sim.num_trajectories, sim.num_steps
+        tracers = sim.tracer_indices()
+        plan = RunPlan(n, steps, None if tracers is None else len(tracers))
+
+        if n <= 0 or steps <= 0:
+            plan.feasible = False
+            plan.reason = "particles and steps must be positive"
+            return plan
+
+        budget = self.memory_budget
+        if budget is None:
+            budget = available_memory()
+        plan.memory_budget = budget
+
+        seconds_per_step, temp_per_particle = self.calibrate(sim)
+        plan.runtime = seconds_per_step * n * steps
+        plan.state_bytes = 2 * n * np.dtype(np.float64).itemsize
+        if sim.stream_moments or tracers is not None or sim.counter_rng:
+            # Начальные координаты для потоковых моментов смещений и replay
+            plan.state_bytes *= 2
+        plan.temp_bytes = temp_per_particle * n
+
+        stride = sim.history_step
+        dtype = sim.history_dtype
+        self._fill(plan, stride, dtype)
+
+        if self.max_runtime is not None and plan.runtime > self.max_runtime:
+            plan.feasible = False
+            plan.reason = (
+                f"expected runtime {plan.runtime:.0f} s exceeds "
+                f"limit {self.max_runtime:.0f} s"
+            )
+            return plan
+
+        if budget is None or plan.peak_bytes <= budget:
+            return plan
+
+        if plan.state_bytes + plan.temp_bytes > budget:
+            plan.feasible = False
+            plan.reason = (
+                "particle state alone needs "
+                f"{format_bytes(plan.state_bytes + plan.temp_bytes)}"
+            )
+            return plan
+
+        # 1-2. float32 и более редкие снимки
+        max_stride = max(stride, steps // self.MIN_SNAPSHOTS)
+        candidates = [(stride, np.float32)]
+        s = stride * 2
+        while s <= max_stride:
+            candidates.append((s, np.float32))
+            s *= 2
+        if candidates[-1][0] != max_stride:
+            candidates.append((max_stride, np.float32))
+
+        for new_stride, new_dtype in candidates:
+            self._fill(plan, new_stride, new_dtype)
+            if plan.peak_bytes <= budget:
+                if np.dtype(new_dtype) != np.dtype(dtype):
+                    plan.changes.append("history stored as float32")
+                if new_stride != stride:
+                    plan.changes.append(
+                        f"history_step increased {stride} -> {new_stride}"
+                    )
+                return plan
+
+        # 3. История на диске, анализ по подвыборке частиц
+        self._fill(plan, stride, dtype)
+        plan.on_disk = True
+        # Писатель архива сохраняет все частицы, а не только трассеры
+        plan.archive_bytes = self.ARCHIVE_RATIO * self._history_bytes(
+            plan, stride, dtype, particles=n
+        )
+        per_particle = self._history_bytes(plan, stride, np.float64, particles=1)
+        free_after_run = budget - plan.state_bytes
+        plan.analysis_particles = int(
+            min(n, free_after_run // (per_particle * (1 + self.ANALYSIS_FACTOR)))
+        )
+        # Буфер писателя: один временной чанк снимков всех частиц
+        snapshot_bytes = 2 * n * np.dtype(np.float64).itemsize
+        free_during_run = budget - plan.state_bytes - plan.temp_bytes
+        plan.chunk_snapshots = int(min(16, free_during_run // snapshot_bytes))
+        plan.history_bytes = plan.chunk_snapshots * snapshot_bytes
+        plan.analysis_bytes = (
+            per_particle * plan.analysis_particles * (1 + self.ANALYSIS_FACTOR)
+        )
+        plan.peak_bytes = plan.state_bytes + max(
+            plan.temp_bytes + plan.history_bytes, plan.analysis_bytes
+        )
+        plan.changes.append("history written to disk archive")
+        plan.changes.append(f"analysis on {plan.analysis_particles} of {n} particles")
+
+        free_disk = shutil.disk_usage(self.archive_dir).free
+        if plan.archive_bytes > free_disk:
+            plan.feasible = False
+            plan.reason = (
+                f"archive needs ~{format_bytes(plan.archive_bytes)}, "
+                f"only {format_bytes(free_disk)} free on disk"
+            )
+        elif plan.chunk_snapshots < 2:
+            plan.feasible = False
+            plan.reason = "not enough memory to buffer archive chunks"
+        elif plan.analysis_particles < self.MIN_ANALYSIS_PARTICLES:
+            plan.feasible = False
+            plan.reason = "not enough memory to analyse the archived history"
+
+        return plan
@@ -2,6 +2,8 @@ import matplotlib.cm as cm
 import matplotlib.pyplot as plt
 import numpy as np
 
+from analytics import PhysicsAnalyzer
+
 
 class SimulationPlotter:
     @staticmethod
@@ -46,7 +48,7 @@ class SimulationPlotter:
         hist_y = np.array(sim.history_y)
 
         colors = cm.rainbow(np.linspace(0, 1, num_trajectories))
-        count = min(num_trajectories, sim.num_trajectories)
+        count = min(num_trajectories, hist_x.shape[1])
 
         for i in range(count):
             # Линия траектории
@@ -81,13 +83,8 @@ class SimulationPlotter:
         """
         fig, ax = plt.subplots(figsize=(8, 6))
 
-        X = np.array(sim.history_x)
-        Y = np.array(sim.history_y)
-
         # MSD для ансамбля частиц
-        R2 = (X - X[0]) ** 2 + (Y - Y[0]) ** 2
-        mean_r2 = np.mean(R2, axis=1)
-        steps = np.arange(len(mean_r2)) * sim.history_step
+        steps, mean_r2 = PhysicsAnalyzer.calculate_msd(sim)
 
         ax.plot(steps, mean_r2, label="Simulation <r^2>", color="blue", lw=2)
 
@@ -130,3 +127,64 @@ class SimulationPlotter:
         ax.legend()
 
         return fig
+
+    @staticmethod
+    def plot_survival_curves(fpt, title="First-Passage Survival"):
+        """
+        Кривые выживания S(t) для всех целей FirstPassageRecorder.
+        """
+        fig, ax = plt.subplots(figsize=(8, 6))
+
+        for name in fpt.targets:
+            steps, survival = PhysicsAnalyzer.calculate_survival_curve(fpt, name)
+            mfpt, fraction, _ = PhysicsAnalyzer.calculate_mean_first_passage(fpt, name)
+            ax.plot(
+                steps, survival, lw=2, label=f"{name} (MFPT={mfpt:.0f}, {fraction:.0%})"
+            )
+
+        ax.set_title(title)
+        ax.set_xlabel("Steps")
+        ax.set_ylabel("S(t)")
+        ax.set_ylim(0, 1.05)
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+
+        return fig
+
+    @staticmethod
+    def draw_density_field(ax, field, geo_strategy=None):
+        """
+        Тепловая карта концентрации DensityField на заданных осях
+        (с геометрией поверх, если она передана).
+        """
+        _, _, density = PhysicsAnalyzer.calculate_density_field(field)
+        image = ax.imshow(
+            density,
+            origin="lower",
+            extent=field.extent,
+            cmap="inferno",
+            interpolation="nearest",
+            aspect="equal",
+        )
+        if geo_strategy is not None:
+            xmin, xmax, ymin, ymax = field.extent
+            geo_strategy.draw(ax, (xmin, xmax), (ymin, ymax))
+            ax.set_xlim(xmin, xmax)
+            ax.set_ylim(ymin, ymax)
+        return image
+
+    @staticmethod
+    def plot_density_field(field, geo_strategy=None, title="Concentration Map"):
+        """
+        Двумерная карта концентрации (частиц на единицу площади).
+        """
+        fig, ax = plt.subplots(figsize=(8, 7))
+
+        image = SimulationPlotter.draw_density_field(ax, field, geo_strategy)
+        fig.colorbar(image, ax=ax, label="Particles / Area")
+
+        ax.set_title(title)
+        ax.set_xlabel("X coordinate")
+        ax.set_ylabel("Y coordinate")
+
+        return fig
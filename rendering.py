@@ -0,0 +1,123 @@
+import matplotlib.patches
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.collections import PatchCollection
+
+from geometry import (
+    ConcentricCirclesGeometry,
+    EmptyGeometry,
+    ParallelLinesGeometry,
+    RandomObstaclesGeometry,
+)
+
+
+class GeometryRenderer:
+    """
+    Отрисовка геометрий на осях matplotlib.
+    Вынесена из geometry.py, чтобы расчетные процессы не импортировали
+    matplotlib; GeometryStrategy.draw подгружает модуль лениво.
+    """
+
+    @staticmethod
+    def draw(geometry, ax, x_lim, y_lim):
+        for geo_cls, painter in GeometryRenderer._PAINTERS:
+            if isinstance(geometry, geo_cls):
+                painter(geometry, ax, x_lim, y_lim)
+                return
+        raise ValueError(f"No renderer for geometry: {type(geometry).__name__}")
+
+    # --- 1. ПАРАЛЛЕЛЬНЫЕ ЛИНИИ ---
+    @staticmethod
+    def draw_parallel_lines(geo, ax, x_lim, y_lim):
+        ymin, ymax = y_lim
+        xmin, xmax = x_lim
+        min_k = int(np.floor(ymin / geo.barrier_dist))
+        max_k = int(np.ceil(ymax / geo.barrier_dist))
+        L = geo.hole_size * 4.0
+
+        for k in range(min_k, max_k + 1):
+            if k == 0:
+                continue
+            y_pos = k * geo.barrier_dist
+            offset = (L / 2.0) if (k % 2 != 0) else 0.0
+
+            start_n = int(np.floor((xmin - offset) / L)) - 1
+            end_n = int(np.ceil((xmax - offset) / L)) + 1
+
+            for n in range(start_n, end_n):
+                center = n * L + offset
+                wall_start_x = center + geo.hole_size / 2.0
+                wall_end_x = (center + L) - geo.hole_size / 2.0
+
+                if wall_end_x < xmin or wall_start_x > xmax:
+                    continue
+                ax.plot(
+                    [wall_start_x, wall_end_x], [y_pos, y_pos], color="black", lw=1.5
+                )
+
+    # --- 2. ПУСТОЕ ПРОСТРАНСТВО ---
+    @staticmethod
+    def draw_empty(geo, ax, x_lim, y_lim):
+        pass
+
+    # --- 3. КОНЦЕНТРИЧЕСКИЕ КРУГИ ---
+    @staticmethod
+    def draw_concentric_circles(geo, ax, x_lim, y_lim):
+        max_dim = max(abs(x_lim[1]), abs(y_lim[1]))
+        max_k = int(np.ceil(max_dim / geo.radius_step))
+        L = geo.hole_size * 4.0
+
+        for k in range(1, max_k + 1):
+            r = k * geo.radius_step
+            circumference = 2 * np.pi * r
+            n_holes = int(circumference / L)
+            if n_holes == 0:
+                n_holes = 1
+
+            d_theta = (2 * np.pi) / n_holes
+            offset_angle = (d_theta / 2.0) if (k % 2 != 0) else 0.0
+            hole_angle = geo.hole_size / r
+
+            for i in range(n_holes):
+                center_angle = i * d_theta + offset_angle
+                start_angle = center_angle + hole_angle / 2.0
+                end_angle = (center_angle + d_theta) - hole_angle / 2.0
+
+                theta1 = np.degrees(start_angle)
+                theta2 = np.degrees(end_angle)
+
+                arc = matplotlib.patches.Arc(
+                    (0, 0),
+                    2 * r,
+                    2 * r,
+                    theta1=theta1,
+                    theta2=theta2,
+                    color="black",
+                    lw=1.5,
+                )
+                ax.add_patch(arc)
+
+    # --- 4. СЛУЧАЙНЫЕ ПРЕПЯТСТВИЯ ---
+    @staticmethod
+    def draw_random_obstacles(geo, ax, x_lim, y_lim):
+        # Только видимые препятствия одной коллекцией (их может быть 10^5)
+        r = geo.r_obs
+        visible = (
+            (geo.centers_x >= x_lim[0] - r)
+            & (geo.centers_x <= x_lim[1] + r)
+            & (geo.centers_y >= y_lim[0] - r)
+            & (geo.centers_y <= y_lim[1] + r)
+        )
+        circles = [
+            plt.Circle((cx, cy), r)
+            for cx, cy in zip(geo.centers_x[visible], geo.centers_y[visible])
+        ]
+        ax.add_collection(PatchCollection(circles, color="black", alpha=0.5))
+
+
+GeometryRenderer._PAINTERS = [
+    (ParallelLinesGeometry, GeometryRenderer.draw_parallel_lines),
+    (EmptyGeometry, GeometryRenderer.draw_empty),
+    (ConcentricCirclesGeometry, GeometryRenderer.draw_concentric_circles),
+    (RandomObstaclesGeometry, GeometryRenderer.draw_random_obstacles),
+]
@@ -1,27 +1,51 @@
+import os
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from statistics import NormalDist
 
 import numpy as np
 
-from geometry import GeometryFactory
+from geometry import GeometryFactory, GeometryStrategy
 
 # --- STRATEGY PATTERN (Движение) ---
 
 
 class MovementStrategy(ABC):
+    """
+    rng: генератор случайных чисел (np.random.Generator); None — глобальный
+    np.random.
+    """
+
     @abstractmethod
-    def get_displacement(self, num_particles, dt=1.0):
+    def get_displacement(self, num_particles, dt=1.0, rng=None):
         pass
 
 
 class NormalMovement(MovementStrategy):
     """
     Нормальное (Гауссовское) распределение смещений.
+    antithetic: антитетические пары — вторая половина частиц получает
+    смещения первой половины с обратным знаком (частица i <-> i + (N+1)//2).
     """
 
-    def get_displacement(self, num_particles, dt=1.0):
+    def __init__(self, antithetic=False):
+        self.antithetic = antithetic
+
+    def get_displacement(self, num_particles, dt=1.0, rng=None):
+        rng = np.random if rng is None else rng
         scale = np.sqrt(0.5)
-        dx = np.random.normal(loc=0.0, scale=scale, size=num_particles) * np.sqrt(dt)
-        dy = np.random.normal(loc=0.0, scale=scale, size=num_particles) * np.sqrt(dt)
+        if self.antithetic:
+            half = (num_particles + 1) // 2
+            dx, dy = self._draw(half, scale, dt, rng)
+            dx = np.concatenate([dx, -dx])[:num_particles]
+            dy = np.concatenate([dy, -dy])[:num_particles]
+            return dx, dy
+        return self._draw(num_particles, scale, dt, rng)
+
+    @staticmethod
+    def _draw(num_particles, scale, dt, rng):
+        dx = rng.normal(loc=0.0, scale=scale, size=num_particles) * np.sqrt(dt)
+        dy = rng.normal(loc=0.0, scale=scale, size=num_particles) * np.sqrt(dt)
         return dx, dy
 
 
@@ -33,19 +57,203 @@ class MaxwellMovement(MovementStrategy):
     def __init__(self, beta=0.5):
         self.beta = beta
 
-    def get_displacement(self, num_particles, dt=1.0):
-        vx = np.random.normal(0, self.beta, num_particles)
-        vy = np.random.normal(0, self.beta, num_particles)
-        vz = np.random.normal(0, self.beta, num_particles)
+    def get_displacement(self, num_particles, dt=1.0, rng=None):
+        rng = np.random if rng is None else rng
+        vx = rng.normal(0, self.beta, num_particles)
+        vy = rng.normal(0, self.beta, num_particles)
+        vz = rng.normal(0, self.beta, num_particles)
         speed = np.sqrt(vx**2 + vy**2 + vz**2)
 
-        angle = np.random.uniform(0, 2 * np.pi, num_particles)
+        angle = rng.uniform(0, 2 * np.pi, num_particles)
 
         dx = speed * np.cos(angle) * np.sqrt(dt)
         dy = speed * np.sin(angle) * np.sqrt(dt)
         return dx, dy
 
 
+class TabulatedMovement(MovementStrategy):
+    """
+    Длина шага из произвольного распределения, направление равномерное.
+
+    Распределение задается таблицей квантилей (обратная функция
+    распределения в узлах u = 0..1 с равным шагом); выборка — линейная
+    интерполяция по таблице, векторизованно для всех частиц сразу:
+    два равномерных числа, cos и sin на частицу.
+    Конструкторы: from_pdf, from_histogram, from_samples, maxwell, levy.
+    """
+
+    def __init__(self, quantiles):
+        self.quantiles = np.asarray(quantiles, dtype=float)
+        if len(self.quantiles) < 2 or np.any(np.diff(self.quantiles) < 0):
+            raise ValueError("Quantile table must be non-decreasing, size >= 2")
+        self._delta = np.diff(self.quantiles)
+
+    @classmethod
+    def from_cdf(cls, r_grid, cdf, table_size=16384):
+        """Таблица из значений функции распределения на сетке r_grid."""
+        cdf = np.asarray(cdf, dtype=float)
+        cdf = (cdf - cdf[0]) / (cdf[-1] - cdf[0])
+        u = np.linspace(0.0, 1.0, table_size)
+        return cls(np.interp(u, cdf, r_grid))
+
+    @classmethod
+    def from_pdf(
+        cls, pdf, r_max, r_min=0.0, num_points=65536, log_grid=False, table_size=16384
+    ):
+        """
+        pdf: функция плотности длины шага (векторизованная), интегрируется
+        численно на [r_min, r_max]; log_grid — логарифмическая сетка для
+        распределений с тяжелыми хвостами.
+        """
+        if log_grid:
+            r_grid = np.geomspace(r_min, r_max, num_points)
+        else:
+            r_grid = np.linspace(r_min, r_max, num_points)
+        p = np.asarray(pdf(r_grid), dtype=float)
+        cdf = np.concatenate(
+            [[0.0], np.cumsum(0.5 * (p[1:] + p[:-1]) * np.diff(r_grid))]
+        )
+        return cls.from_cdf(r_grid, cdf, table_size)
+
+    @classmethod
+    def from_histogram(cls, counts, edges, table_size=16384):
+        """Измеренная гистограмма длин шагов (плотность постоянна в бине)."""
+        cdf = np.concatenate([[0.0], np.cumsum(counts)])
+        return cls.from_cdf(np.asarray(edges, dtype=float), cdf, table_size)
+
+    @classmethod
+    def from_samples(cls, samples, table_size=16384):
+        """Эмпирическое распределение по выборке длин шагов."""
+        u = np.linspace(0.0, 1.0, table_size)
+        return cls(np.quantile(np.asarray(samples, dtype=float), u))
+
+    @classmethod
+    def maxwell(cls, beta=0.5, table_size=16384):
+        """
+        Модуль скорости из распределения Максвелла (как в MaxwellMovement):
+        f(v) ~ v^2 exp(-v^2 / 2 beta^2).
+        """
+        return cls.from_pdf(
+            lambda v: v**2 * np.exp(-(v**2) / (2 * beta**2)),
+            r_max=6.0 * beta,
+            table_size=table_size,
+        )
+
+    @classmethod
+    def levy(cls, alpha=1.5, r_min=0.5, r_max=1000.0, table_size=16384):
+        """
+        Полеты Леви: усеченное степенное распределение
+        f(r) ~ r^-(1 + alpha) на [r_min, r_max]; квантили точные в узлах.
+        """
+        u = np.linspace(0.0, 1.0, table_size)
+        tail = 1.0 - (r_min / r_max) ** alpha
+        return cls(r_min * (1.0 - u * tail) ** (-1.0 / alpha))
+
+    def get_displacement(self, num_particles, dt=1.0, rng=None):
+        rng = np.random if rng is None else rng
+        pos = rng.random(num_particles) * (len(self.quantiles) - 1)
+        idx = pos.astype(np.intp)
+        np.minimum(idx, len(self._delta) - 1, out=idx)
+        step = self.quantiles[idx] + (pos - idx) * self._delta[idx]
+        step *= np.sqrt(dt)
+
+        angle = rng.random(num_particles) * (2 * np.pi)
+        return step * np.cos(angle), step * np.sin(angle)
+
+
+# --- СЧЕТНЫЙ ГЕНЕРАТОР (Воспроизводимые траектории) ---
+
+
+class CounterRandomStream:
+    """
+    Случайные числа одного шага, зависящие только от (seed, частица, шаг).
+
+    Каждый вызов random / uniform забирает очередной слот; слот s шага step —
+    отдельный поток Philox с ключом seed и счетчиком [блок, s, step, 0],
+    частица i берет из него слово i. Поэтому значения частицы не зависят
+    от того, сколько и каких частиц генерируется вместе: весь ансамбль за
+    один вызов random_raw или отдельные частицы при восстановлении.
+    normal — преобразование Бокса-Мюллера по двум слотам, вторая величина
+    пары отдается следующему вызову normal.
+
+    Интерфейс — подмножество np.random.Generator; размер выборки всегда
+    равен числу частиц. particles: число N (частицы 0..N-1), slice или
+    массив индексов.
+    """
+
+    # Для массива индексов: читать подряд, если это не дороже в SPAN_RATIO раз
+    SPAN_RATIO = 512
+
+    def __init__(self, seed, step, particles):
+        self.seed = seed
+        self.step = step
+        if np.isscalar(particles):
+            particles = slice(0, int(particles))
+        if isinstance(particles, slice):
+            self.start, self.stop = particles.start or 0, particles.stop
+            self.index = None
+            self.size = self.stop - self.start
+        else:
+            self.index = np.asarray(particles, dtype=np.intp)
+            self.size = len(self.index)
+        self._slot = 0
+        self._spare = None
+        self._bitgen = np.random.Philox(key=seed)
+
+    def _words(self, start, stop, slot):
+        """Слова потока слота для частиц start..stop-1."""
+        block = start // 4
+        bitgen = np.random.Philox(key=self.seed, counter=[block, slot, self.step, 0])
+        raw = bitgen.random_raw(stop - 4 * block)
+        return raw[start - 4 * block :]
+
+    def _raw(self):
+        slot = self._slot
+        self._slot += 1
+        if self.index is None:
+            return self._words(self.start, self.stop, slot)
+        if self.size == 0:
+            return np.empty(0, dtype=np.uint64)
+
+        lo, hi = self.index.min(), self.index.max() + 1
+        if hi - lo <= self.SPAN_RATIO * self.size:
+            return self._words(lo, hi, slot)[self.index - lo]
+
+        # Разреженный набор: переход к блоку каждой частицы
+        state = self._bitgen.state
+        counter = state["state"]["counter"]
+        out = np.empty(self.size, dtype=np.uint64)
+        for k, i in enumerate(self.index):
+            counter[:] = (i // 4, slot, self.step, 0)
+            state["buffer_pos"] = 4
+            self._bitgen.state = state
+            out[k] = self._bitgen.random_raw(4)[i % 4]
+        return out
+
+    def _check(self, size):
+        if size is not None and size != self.size:
+            raise ValueError("counter RNG draws exactly one value per particle")
+
+    def random(self, size=None):
+        self._check(size)
+        return (self._raw() >> np.uint64(11)) * (1.0 / 2**53)
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        return low + (high - low) * self.random(size)
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        self._check(size)
+        if self._spare is not None:
+            z, self._spare = self._spare, None
+        else:
+            # u1 в (0, 1], чтобы логарифм был конечен
+            u1 = 1.0 - self.random()
+            theta = (2 * np.pi) * self.random()
+            radius = np.sqrt(-2.0 * np.log(u1))
+            z, self._spare = radius * np.cos(theta), radius * np.sin(theta)
+        return loc + scale * z
+
+
 # --- FACTORY ---
 
 
@@ -53,14 +261,75 @@ class StrategyFactory:
     @staticmethod
     def create(movement_type, **kwargs):
         if movement_type == "normal":
-            return NormalMovement()
+            return NormalMovement(antithetic=kwargs.get("antithetic", False))
         elif movement_type == "maxwell":
+            # Табличная выборка: то же распределение, что MaxwellMovement
             beta = kwargs.get("beta", 0.5)
-            return MaxwellMovement(beta=beta)
+            return TabulatedMovement.maxwell(beta=beta)
+        elif movement_type == "maxwell_direct":
+            return MaxwellMovement(beta=kwargs.get("beta", 0.5))
+        elif movement_type == "levy":
+            return TabulatedMovement.levy(
+                alpha=kwargs.get("levy_alpha", 1.5),
+                r_min=kwargs.get("levy_r_min", 0.5),
+                r_max=kwargs.get("levy_r_max", 1000.0),
+            )
+        elif movement_type == "tabulated":
+            if "step_histogram" in kwargs:
+                counts, edges = kwargs["step_histogram"]
+                return TabulatedMovement.from_histogram(counts, edges)
+            if "step_samples" in kwargs:
+                return TabulatedMovement.from_samples(kwargs["step_samples"])
+            if "step_pdf" in kwargs:
+                return TabulatedMovement.from_pdf(
+                    kwargs["step_pdf"], r_max=kwargs.get("step_r_max", 10.0)
+                )
+            raise ValueError(
+                "Tabulated movement needs step_pdf, step_histogram or step_samples"
+            )
         else:
             raise ValueError(f"Unknown movement type: {movement_type}")
 
 
+# --- OBSERVER (Наблюдатели контрольных точек) ---
+
+
+class SnapshotObserver(ABC):
+    """
+    Наблюдатель за ходом симуляции: получает состояние движка в начале,
+    после каждого шага (on_step), в каждой контрольной точке (шаг кратен
+    history_step) и в конце. В адаптивном режиме (adaptive_miss) частицы
+    идут несинхронно между контрольными точками и on_step не вызывается.
+    """
+
+    def on_start(self, sim):
+        pass
+
+    def on_step(self, sim, step):
+        pass
+
+    def on_chunk_step(self, sim, step, x, y, offset):
+        """
+        Аналог on_step для блочного режима (chunk_size): x, y — координаты
+        частиц offset..offset+len(x) после шага step. Вызывается из рабочих
+        потоков параллельно для непересекающихся блоков.
+        """
+        pass
+
+    def on_snapshot(self, sim, step):
+        pass
+
+    def on_finish(self, sim):
+        pass
+
+    def on_abort(self, sim):
+        """
+        Расчет прерван исключением (в т.ч. KeyboardInterrupt) после on_start:
+        вместо on_finish освобождаются ресурсы (файлы, потоки).
+        """
+        pass
+
+
 # --- ENGINE (Контекст) ---
 
 
@@ -76,11 +345,27 @@ class SimulationEngine:
         self.num_trajectories = num_trajectories
         self.num_steps = num_steps
 
+        # Параметры запуска (для архива и повторных прогонов)
+        self.config = {
+            "num_trajectories": num_trajectories,
+            "num_steps": num_steps,
+            "movement_type": movement_type,
+            "geometry_type": (
+                geometry_type
+                if isinstance(geometry_type, str)
+                else type(geometry_type).__name__
+            ),
+            **kwargs,
+        }
+
         # 1. Стратегия Движения (Физика)
         self.move_strategy = StrategyFactory.create(movement_type, **kwargs)
 
-        # 2. Стратегия Геометрии (Стены)
-        self.geo_strategy = GeometryFactory.create(geometry_type, **kwargs)
+        # 2. Стратегия Геометрии (Стены): тип или готовый экземпляр
+        if isinstance(geometry_type, GeometryStrategy):
+            self.geo_strategy = geometry_type
+        else:
+            self.geo_strategy = GeometryFactory.create(geometry_type, **kwargs)
 
         self.x = np.zeros(self.num_trajectories)
         self.y = np.zeros(self.num_trajectories)
@@ -88,39 +373,294 @@ class SimulationEngine:
         self.history_step = 100
         self.history_x = []
         self.history_y = []
-
-    def run(self):
-        # Сохранение начального состояния
-        self.history_x.append(self.x.copy())
-        self.history_y.append(self.y.copy())
-
-        print(
-            f"Simulating: {self.num_trajectories} particles, "
-            f"Movement: {self.move_strategy.__class__.__name__}, "
-            f"Geometry: {self.geo_strategy.__class__.__name__}"
+        # Тип хранения истории (np.float32 вдвое экономит память)
+        self.history_dtype = np.float64
+        # False: история не хранится в памяти (например, пишется на диск)
+        self.keep_history = True
+        # Трассеры: полная история только для подмножества частиц (число k —
+        # первые k частиц, либо массив индексов).
+        self.tracers = None
+        self._tracer_idx = None
+
+        # Потоковые моменты смещений всего ансамбля в контрольных точках:
+        # строка moments = (n, sum dx^2, sum dy^2, sum dx*dy, sum dr^4),
+        # msd — средний квадрат смещения. Нужны только начальные координаты.
+        # Всегда включены при трассерах.
+        self.stream_moments = True
+        self.moments = None
+        self.msd = None
+
+        # Счетный генератор: смещения частицы на шаге определяются только
+        # (seed, частица, шаг), поэтому траекторию любой частицы можно
+        # восстановить после прогона (replay) без хранения истории.
+        self.counter_rng = False
+        self._x0 = None
+        self._y0 = None
+
+        # Блочный режим: частицы делятся на блоки по chunk_size, каждый блок
+        # проходит все шаги до следующей контрольной точки, пока он в кэше.
+        # Блоки обрабатываются в пуле из num_threads потоков (NumPy отпускает
+        # GIL), у каждого блока свой поток случайных чисел из seed.
+        self.chunk_size = None
+        self.num_threads = None
+        self.seed = None
+
+        # Адаптивный режим (только NormalMovement): частица вдали от стен
+        # объединяет k шагов в одно гауссово смещение с дисперсией k * sigma^2.
+        # k выбирается по расстоянию до стены (geo_strategy.wall_distance) так,
+        # чтобы вероятность задеть стену внутри объединенного шага не
+        # превышала adaptive_miss. Все частицы синхронно доходят до
+        # контрольных точек; on_step не вызывается.
+        self.adaptive_miss = None
+        self.adaptive_draws = 0
+
+        self.observers = []
+
+    def add_observer(self, observer):
+        """Подключает SnapshotObserver (архив, онлайн-аналитика и т.п.)."""
+        self.observers.append(observer)
+        return observer
+
+    def tracer_indices(self):
+        """Индексы частиц, для которых хранится история (None — все)."""
+        if self.tracers is None:
+            return None
+        if np.isscalar(self.tracers):
+            return np.arange(min(int(self.tracers), self.num_trajectories))
+        return np.asarray(self.tracers, dtype=np.intp)
+
+    def record_history(self):
+        """Сохраняет текущие координаты частиц (или трассеров) в историю."""
+        if self._tracer_idx is None:
+            self.history_x.append(self.x.astype(self.history_dtype))
+            self.history_y.append(self.y.astype(self.history_dtype))
+        else:
+            self.history_x.append(self.x[self._tracer_idx].astype(self.history_dtype))
+            self.history_y.append(self.y[self._tracer_idx].astype(self.history_dtype))
+
+    def advance(self, dx, dy):
+        """
+        Один шаг по заданным смещениям: движение + проверка геометрии.
+        Позволяет подавать внешний поток смещений (например, общий для
+        нескольких геометрий).
+        """
+        proposed_x = self.x + dx
+        proposed_y = self.y + dy
+
+        self.x, self.y = self.geo_strategy.apply_boundaries(
+            self.x, self.y, proposed_x, proposed_y
         )
 
+    def _checkpoint(self, step):
+        if self.moments is not None:
+            dx = self.x - self._x0
+            dy = self.y - self._y0
+            r2 = dx**2 + dy**2
+            n = len(r2)
+            self.moments.append(
+                (n, dx @ dx, dy @ dy, dx @ dy, r2 @ r2) if n else (0, 0, 0, 0, 0)
+            )
+            self.msd.append(float(np.sum(r2) / n) if n else 0.0)
+        if self.keep_history:
+            self.record_history()
+        for observer in self.observers:
+            observer.on_snapshot(self, step)
+
+    def _advance_chunk(self, start, stop, first_step, last_step, rng):
+        """Проводит блок частиц [start, stop) через шаги first_step..last_step."""
+        x = self.x[start:stop]
+        y = self.y[start:stop]
+        for step in range(first_step, last_step + 1):
+            if self.counter_rng:
+                rng = CounterRandomStream(self.seed, step, slice(start, stop))
+            dx, dy = self.move_strategy.get_displacement(len(x), rng=rng)
+            x, y = self.geo_strategy.apply_boundaries(x, y, x + dx, y + dy)
+            for observer in self.observers:
+                observer.on_chunk_step(self, step, x, y, start)
+        self.x[start:stop] = x
+        self.y[start:stop] = y
+
+    def _run_chunked(self):
+        bounds = [
+            (start, min(start + self.chunk_size, self.num_trajectories))
+            for start in range(0, self.num_trajectories, self.chunk_size)
+        ]
+        seeds = np.random.SeedSequence(self.seed).spawn(len(bounds))
+        rngs = [np.random.default_rng(s) for s in seeds]
+
+        # Массивы состояния пишутся блоками на месте
+        self.x = np.array(self.x, dtype=float)
+        self.y = np.array(self.y, dtype=float)
+
+        with ThreadPoolExecutor(self.num_threads or os.cpu_count()) as pool:
+            step = 0
+            while step < self.num_steps:
+                # Все блоки синхронно доходят до следующей контрольной точки
+                target = min(
+                    (step // self.history_step + 1) * self.history_step,
+                    self.num_steps,
+                )
+                futures = [
+                    pool.submit(self._advance_chunk, a, b, step + 1, target, rng)
+                    for (a, b), rng in zip(bounds, rngs)
+                ]
+                for future in futures:
+                    future.result()
+
+                step = target
+                if step % self.history_step == 0:
+                    self._checkpoint(step)
+
+    def _run_serial(self):
+        rng = None if self.seed is None else np.random.default_rng(self.seed)
         for step in range(1, self.num_steps + 1):
+            if self.counter_rng:
+                rng = CounterRandomStream(self.seed, step, self.num_trajectories)
             # A. Расчет смещения (Physics)
-            dx, dy = self.move_strategy.get_displacement(self.num_trajectories)
+            dx, dy = self.move_strategy.get_displacement(self.num_trajectories, rng=rng)
 
-            current_x = self.x
-            current_y = self.y
+            # B-C. Применение геометрии и обновление состояния
+            self.advance(dx, dy)
 
-            proposed_x = current_x + dx
-            proposed_y = current_y + dy
+            for observer in self.observers:
+                observer.on_step(self, step)
 
-            # B. Применение геометрии (Geometry collision check)
-            final_x, final_y = self.geo_strategy.apply_boundaries(
-                current_x, current_y, proposed_x, proposed_y
+            if step % self.history_step == 0:
+                self._checkpoint(step)
+
+    def _combined_steps(self, x, y, remaining, z):
+        """
+        Число шагов k, объединяемых в одно смещение. По принципу отражения
+        P(max |W| >= d за k шагов) <= 4 * P(W_k >= d), поэтому достаточно
+        d >= z * sigma * sqrt(k), где z — квантиль уровня 1 - adaptive_miss / 4.
+        """
+        sigma = np.sqrt(0.5)
+        distance = self.geo_strategy.wall_distance(x, y)
+        k = np.floor((distance / (z * sigma)) ** 2)
+        return np.clip(k, 1, remaining).astype(np.int64)
+
+    def _run_adaptive(self):
+        move = self.move_strategy
+        if self.counter_rng:
+            raise ValueError("adaptive mode does not support the counter RNG")
+        if not isinstance(move, NormalMovement) or move.antithetic:
+            raise ValueError("adaptive mode requires NormalMovement without pairs")
+        if self.geo_strategy.wall_distance(self.x[:1], self.y[:1]) is None:
+            raise ValueError(
+                f"{type(self.geo_strategy).__name__} does not support adaptive mode"
             )
 
-            # C. Обновление состояния
-            self.x = final_x
-            self.y = final_y
+        rng = None if self.seed is None else np.random.default_rng(self.seed)
+        z = NormalDist().inv_cdf(1.0 - self.adaptive_miss / 4.0)
+        self.x = np.array(self.x, dtype=float)
+        self.y = np.array(self.y, dtype=float)
+        self.adaptive_draws = 0
 
+        step = 0
+        while step < self.num_steps:
+            target = min(
+                (step // self.history_step + 1) * self.history_step, self.num_steps
+            )
+            remaining = np.full(self.num_trajectories, target - step, dtype=np.int64)
+            active = np.arange(self.num_trajectories)
+            x, y = self.x, self.y
+
+            # Частицы у стен делают больше проходов, дальние — меньше;
+            # дошедшие до контрольной точки записываются в состояние один раз
+            while len(active):
+                k = self._combined_steps(x, y, remaining, z)
+                dx, dy = move.get_displacement(len(active), k, rng)
+                x, y = self.geo_strategy.apply_boundaries(x, y, x + dx, y + dy)
+                self.adaptive_draws += len(active)
+
+                remaining = remaining - k
+                left = remaining > 0
+                done = ~left
+                self.x[active[done]] = x[done]
+                self.y[active[done]] = y[done]
+                active, x, y, remaining = (
+                    active[left],
+                    x[left],
+                    y[left],
+                    remaining[left],
+                )
+
+            step = target
             if step % self.history_step == 0:
-                self.history_x.append(self.x.copy())
-                self.history_y.append(self.y.copy())
+                self._checkpoint(step)
+
+    def replay(self, particles, history_step=None):
+        """
+        Восстанавливает траектории выбранных частиц прогона со счетным
+        генератором (counter_rng): каждая частица проходится заново с теми же
+        случайными числами и взаимодействиями с геометрией, остальные частицы
+        не моделируются. Подходит и новый движок с тем же config, seed и
+        геометрией (начальные координаты — нули, если прогона не было).
+        Возвращает (history_x, history_y) формы (снимки, частицы).
+        """
+        if not self.counter_rng or self.seed is None:
+            raise ValueError("replay requires counter_rng and a seed")
+        idx = np.asarray(particles, dtype=np.intp)
+        every = history_step or self.history_step
+
+        if self._x0 is not None:
+            x, y = self._x0[idx], self._y0[idx]
+        else:
+            x, y = np.zeros(len(idx)), np.zeros(len(idx))
+        history_x, history_y = [x], [y]
+        for step in range(1, self.num_steps + 1):
+            rng = CounterRandomStream(self.seed, step, idx)
+            dx, dy = self.move_strategy.get_displacement(len(idx), rng=rng)
+            x, y = self.geo_strategy.apply_boundaries(x, y, x + dx, y + dy)
+            if step % every == 0:
+                history_x.append(x)
+                history_y.append(y)
+        return np.array(history_x), np.array(history_y)
+
+    def run(self):
+        try:
+            self._run()
+        except BaseException:
+            for observer in self.observers:
+                observer.on_abort(self)
+            raise
+
+    def _run(self):
+        for observer in self.observers:
+            observer.on_start(self)
+
+        if self.counter_rng and self.seed is None:
+            # Ключ сохраняется, чтобы прогон можно было восстановить
+            self.seed = np.random.SeedSequence().entropy
+
+        self._tracer_idx = self.tracer_indices()
+        if self.stream_moments or self._tracer_idx is not None:
+            self.moments = []
+            self.msd = []
+        else:
+            self.moments = None
+            self.msd = None
+        if self.moments is not None or self.counter_rng:
+            self._x0 = np.array(self.x, dtype=float)
+            self._y0 = np.array(self.y, dtype=float)
+
+        # Сохранение начального состояния
+        self._checkpoint(0)
+
+        print(
+            f"Simulating: {self.num_trajectories} particles, "
+            f"Movement: {self.move_strategy.__class__.__name__}, "
+            f"Geometry: {self.geo_strategy.__class__.__name__}"
+        )
+
+        if self.adaptive_miss:
+            self._run_adaptive()
+        elif self.chunk_size:
+            self._run_chunked()
+        else:
+            self._run_serial()
+
+        for observer in self.observers:
+            observer.on_finish(self)
 
         print("Done.")
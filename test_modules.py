@@ -1,9 +1,39 @@
+import os
+import subprocess
+import sys
+import time
+
 import matplotlib.pyplot as plt
 import numpy as np
+import pytest
 
 from analytics import PhysicsAnalyzer
+from archive import TrajectoryArchive, TrajectoryArchiveWriter
+from comparison import CollisionBenchmark, CommonRandomComparison
+from density import DensityField
+from first_passage import BarrierRowTarget, FirstPassageRecorder, RadiusTarget
+from geometry import RandomObstaclesGeometry
+from jobqueue import (
+    DONE,
+    FAILED,
+    QUEUED,
+    JobQueue,
+    JobWorker,
+    JobWorkerPool,
+    run_job,
+)
+from live_preview import LivePreview
+from permeation import LineSource, PermeationCell, PlaneSink, PointSource, RadialSink
+from pipeline import AnalyticsPipeline, MSDAnalyzer, RadialProfileAnalyzer
+from planner import RunPlanner
 from plotting import SimulationPlotter
-from simulation import SimulationEngine
+from simulation import (
+    MaxwellMovement,
+    NormalMovement,
+    SimulationEngine,
+    TabulatedMovement,
+)
+from tortuosity_map import AdaptiveTortuosityMapper
 
 
 def run_test():
@@ -71,6 +101,7 @@ def run_test():
 def test_all_geometries():
     """
     Тестовое сравнение 4-х типов геометрии на одном холсте.
+    Все геометрии получают общий поток смещений (CRN).
     """
     geometries = ["empty", "parallel", "circle", "random"]
     params = {
@@ -82,14 +113,23 @@ def test_all_geometries():
         "num_obstacles": 40,
     }
 
+    comparison = CommonRandomComparison(geometries, **params)
+    comparison.history_step = 10
+    comparison.run()
+
+    report = comparison.report()
+    for geo, diff in report["differences"].items():
+        print(
+            f"{geo} vs {report['reference']}: "
+            f"ΔD = {diff['slope_diff']:.4f} ± {diff['slope_diff_err']:.4f}, "
+            f"variance reduction x{diff['variance_reduction']:.1f}"
+        )
+
     fig, axes = plt.subplots(2, 2, figsize=(12, 12))
     axes = axes.flatten()
 
     for i, geo in enumerate(geometries):
-        print(f"Testing: {geo}...")
-        sim = SimulationEngine(geometry_type=geo, **params)
-        sim.history_step = 10
-        sim.run()
+        sim = comparison.engines[geo]
 
         ax = axes[i]
 
@@ -118,6 +158,808 @@ def test_all_geometries():
     plt.show()
 
 
+def test_common_random_numbers():
+    """
+    Общий поток смещений: пустая геометрия совпадает сама с собой,
+    а разность с барьерами оценивается точнее независимых прогонов.
+    """
+    comparison = CommonRandomComparison(
+        {"a": "empty", "b": "empty", "walls": "parallel"},
+        num_trajectories=400,
+        num_steps=400,
+        barrier_dist=5.0,
+        hole_size=1.0,
+    )
+    comparison.history_step = 10
+    comparison.run()
+
+    np.testing.assert_array_equal(comparison.engines["a"].x, comparison.engines["b"].x)
+    report = comparison.report(reference="a")
+    assert report["differences"]["b"]["slope_diff"] == 0.0
+    assert report["differences"]["walls"]["slope_diff"] < 0.0
+    assert report["differences"]["walls"]["variance_reduction"] > 1.0
+
+
+def test_antithetic_pairs():
+    move = NormalMovement(antithetic=True)
+    dx, dy = move.get_displacement(7)
+    np.testing.assert_array_equal(dx[4:], -dx[:3])
+    np.testing.assert_array_equal(dy[4:], -dy[:3])
+
+    # Для MSD пара дает те же r^2: сравнение геометрий антитетику отклоняет
+    with pytest.raises(ValueError):
+        CommonRandomComparison(["empty", "parallel"], antithetic=True)
+
+
+def test_trajectory_archive_roundtrip(tmp_path):
+    """
+    Потоковая запись во время run и чтение окна / подмножества частиц.
+    """
+    sim = SimulationEngine(
+        num_trajectories=300, num_steps=500, geometry_type="random", hole_size=3.0
+    )
+    sim.history_step = 10
+    path = str(tmp_path / "run.traj")
+    sim.add_observer(
+        TrajectoryArchiveWriter(path, chunk_snapshots=8, chunk_particles=64)
+    )
+    sim.run()
+
+    hist_x, hist_y = np.array(sim.history_x), np.array(sim.history_y)
+    with TrajectoryArchive(path) as archive:
+        assert archive.num_snapshots == len(hist_x)
+        particles = [0, 70, 299]
+        hx, hy = archive.load(particles, slice(5, 30, 2))
+        np.testing.assert_allclose(hx, hist_x[5:30:2][:, particles], atol=1e-4)
+        np.testing.assert_allclose(hy, hist_y[5:30:2][:, particles], atol=1e-4)
+
+        restored = archive.to_sim()
+        np.testing.assert_array_equal(
+            restored.geo_strategy.centers_x, sim.geo_strategy.centers_x
+        )
+        np.testing.assert_allclose(
+            PhysicsAnalyzer.calculate_diffusion_coefficient(restored),
+            PhysicsAnalyzer.calculate_diffusion_coefficient(sim),
+            rtol=1e-4,
+        )
+        assert archive.complete
+
+    # Прерванный расчет: архив закрывается и читается до точки прерывания
+    def interrupt(step, x, y):
+        if step >= 200:
+            raise KeyboardInterrupt
+
+    sim = SimulationEngine(num_trajectories=100, num_steps=500)
+    sim.history_step = 10
+    path = str(tmp_path / "aborted.traj")
+    sim.add_observer(TrajectoryArchiveWriter(path, chunk_snapshots=8))
+    sim.add_observer(AnalyticsPipeline([interrupt], num_workers=1, max_pending=1))
+    with pytest.raises((KeyboardInterrupt, RuntimeError)):
+        sim.run()
+    with TrajectoryArchive(path) as archive:
+        assert not archive.complete
+        assert 21 <= archive.num_snapshots <= len(sim.history_x)
+        assert len(archive.to_sim().msd) == archive.num_snapshots
+
+
+def test_adaptive_tortuosity_map_budget():
+    """
+    Адаптивная карта τ: грубая сетка + уточнения, бюджет не превышается.
+    """
+    mapper = AdaptiveTortuosityMapper(
+        "parallel",
+        barrier_range=(5.0, 30.0),
+        hole_range=(1.0, 8.0),
+        coarse=3,
+        budget=100 * 200 * 20,
+        num_trajectories=100,
+        num_steps=200,
+        history_step=10,
+    )
+    result = mapper.run()
+
+    assert result["spent"] <= mapper.budget
+    assert result["runs"].sum() * mapper.run_cost == result["spent"]
+    assert len(result["points"]) > 9
+    _, _, tau = mapper.tau_map(5, 5)
+    assert np.all(np.isfinite(tau))
+
+
+def test_first_passage_matches_history():
+    """
+    Времена первого достижения, записанные на лету, совпадают с полученными
+    из полной истории (history_step = 1).
+    """
+    sim = SimulationEngine(
+        num_trajectories=200, num_steps=300, barrier_dist=5.0, hole_size=2.0
+    )
+    sim.history_step = 1
+    fpt = sim.add_observer(
+        FirstPassageRecorder({"r": RadiusTarget(8.0), "row": BarrierRowTarget(1)})
+    )
+    sim.run()
+
+    hx, hy = np.array(sim.history_x), np.array(sim.history_y)
+    for name, hit in [
+        ("r", np.hypot(hx, hy) >= 8.0),
+        ("row", np.floor(hy / 5.0) >= 1),
+    ]:
+        expected = np.where(hit.any(axis=0), hit.argmax(axis=0), -1)
+        np.testing.assert_array_equal(fpt.times[name], expected)
+
+    steps, survival = PhysicsAnalyzer.calculate_survival_curve(fpt, "r")
+    assert survival[0] == 1.0 and np.all(np.diff(survival) <= 0)
+    mfpt, fraction, _ = PhysicsAnalyzer.calculate_mean_first_passage(fpt, "r")
+    assert fraction == np.mean(fpt.times["r"] >= 0)
+
+
+def test_chunked_run_is_thread_independent():
+    """
+    Блочный режим: результат определяется seed и chunk_size, а не числом
+    потоков; контрольные точки совпадают с history_step.
+    """
+    runs = []
+    for threads in (1, 3):
+        sim = SimulationEngine(
+            num_trajectories=1000, num_steps=250, barrier_dist=5.0, hole_size=2.0
+        )
+        sim.history_step = 20
+        sim.chunk_size = 128
+        sim.num_threads = threads
+        sim.seed = 7
+        fpt = sim.add_observer(FirstPassageRecorder([RadiusTarget(6.0)]))
+        sim.run()
+        runs.append((sim, fpt))
+
+    (a, fpt_a), (b, fpt_b) = runs
+    np.testing.assert_array_equal(a.x, b.x)
+    np.testing.assert_array_equal(fpt_a.times["r=6"], fpt_b.times["r=6"])
+    assert len(a.history_x) == 250 // 20 + 1
+    np.testing.assert_array_equal(a.history_y[-1], b.history_y[-1])
+
+
+def test_tabulated_movement_distributions():
+    """
+    Табличная выборка длины шага воспроизводит исходные распределения.
+    """
+    rng = np.random.default_rng(3)
+    n = 200000
+
+    direct = np.hypot(*MaxwellMovement(beta=0.5).get_displacement(n, rng=rng))
+    tabulated = np.hypot(
+        *TabulatedMovement.maxwell(beta=0.5).get_displacement(n, rng=rng)
+    )
+    assert abs(np.mean(tabulated**2) - 0.75) < 0.01
+    assert abs(np.median(tabulated) - np.median(direct)) < 0.01
+
+    counts, edges = np.histogram(direct, bins=100)
+    from_hist = np.hypot(
+        *TabulatedMovement.from_histogram(counts, edges).get_displacement(n, rng=rng)
+    )
+    assert abs(np.mean(from_hist**2) - np.mean(direct**2)) < 0.01
+
+    levy = np.hypot(
+        *TabulatedMovement.levy(alpha=1.5, r_min=0.5).get_displacement(n, rng=rng)
+    )
+    assert levy.min() >= 0.5
+    # P(r > 2 r_min) = 2^-alpha для степенного хвоста
+    assert abs(np.mean(levy > 1.0) - 2**-1.5) < 0.01
+
+
+def test_live_preview_blitting():
+    """
+    Живой просмотр на Agg-холсте: кадры рисуются, облако содержит
+    заданную подвыборку, MSD растет вместе с шагами.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 4))
+    FigureCanvasAgg(fig)
+    sim = SimulationEngine(num_trajectories=2000, num_steps=300)
+    sim.history_step = 10
+    preview = sim.add_observer(
+        LivePreview(fig, subsample=100, fps=1e6, every=20, max_overhead=1e6)
+    )
+    sim.run()
+
+    assert preview.frames == 300 // 20
+    assert preview.scatter.get_offsets().shape == (100, 2)
+    assert preview.msd_steps[-1] == 300
+
+
+def test_run_planner_storage_decisions(tmp_path):
+    """
+    Планировщик: без ограничений настройки не меняются, при тесном бюджете
+    история уплотняется или уходит на диск, невозможный план отклоняется.
+    """
+    sim = SimulationEngine(num_trajectories=20000, num_steps=2000)
+    sim.history_step = 10
+    full = 201 * 20000 * 2 * 8
+
+    np.random.seed(5)
+    plan = RunPlanner(memory_budget=1e12, calibration_steps=2).plan(sim)
+    assert plan.feasible and not plan.changes
+    # Калибровка не сдвигает глобальный поток np.random
+    drawn = np.random.random()
+    np.random.seed(5)
+    assert drawn == np.random.random()
+    assert plan.history_bytes == full and plan.runtime > 0
+
+    plan = RunPlanner(memory_budget=full, calibration_steps=2).plan(sim)
+    assert plan.feasible and plan.peak_bytes <= full
+    assert plan.history_dtype == np.float32 or plan.history_step > 10
+
+    plan = RunPlanner(
+        memory_budget=4e6, calibration_steps=2, archive_dir=str(tmp_path)
+    ).plan(sim)
+    assert plan.feasible and plan.on_disk
+    assert plan.analysis_particles < 20000
+
+    plan = RunPlanner(memory_budget=1e5, calibration_steps=2).plan(sim)
+    assert not plan.feasible
+    try:
+        plan.apply(sim)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("infeasible plan must not be applied")
+
+
+def test_density_field_matches_histogram():
+    """
+    Поле, накопленное в контрольных точках окна, совпадает с гистограммой
+    сохраненной истории.
+    """
+    sim = SimulationEngine(
+        num_trajectories=3000, num_steps=400, barrier_dist=10.0, hole_size=3.0
+    )
+    sim.history_step = 20
+    extent = (-30.0, 30.0, -20.0, 20.0)
+    field = sim.add_observer(
+        DensityField(bins=(30, 20), extent=extent, window=(200, 400))
+    )
+    sim.run()
+
+    hx = np.array(sim.history_x)[10:].ravel()
+    hy = np.array(sim.history_y)[10:].ravel()
+    expected, _, _ = np.histogram2d(
+        hy, hx, bins=(20, 30), range=[extent[2:], extent[:2]]
+    )
+    assert field.num_snapshots == 11
+    np.testing.assert_array_equal(field.counts, expected)
+    assert field.outside == len(hx) - expected.sum()
+
+    _, _, density = PhysicsAnalyzer.calculate_density_field(field)
+    np.testing.assert_allclose(density.sum() * field.cell_area * 11, expected.sum())
+
+
+def test_permeation_steady_flux():
+    """
+    Источник и поглощающие стоки в пустой геометрии: в стационаре поток
+    уравновешивает инжекцию, а D_eff из закона Фика совпадает со
+    свободной диффузией (D = 1/4 для нормального шага).
+    """
+    length, width = 12.0, 8.0
+    sim = SimulationEngine(num_trajectories=0, num_steps=4000, geometry_type="empty")
+    sim.keep_history = False
+    sim.history_step = 10
+    cell = sim.add_observer(
+        PermeationCell(
+            {"top": PlaneSink(length), "bottom": PlaneSink(-length, side="below")},
+            [LineSource(5.0, level=0.5, span=(0.0, width))],
+            wrap_x=(0.0, width),
+            profile=("y", 0.5, length, 24),
+            steady_from=1500,
+            seed=1,
+        )
+    )
+    sim.run()
+
+    assert sim.num_trajectories == len(sim.x) == len(cell.alive)
+    assert np.count_nonzero(cell.alive) == cell.active[-1]
+    assert cell.injected.sum() == 5 * 4000
+    absorbed = sum(a.sum() for a in cell.absorbed.values())
+    assert absorbed + cell.active[-1] == cell.injected.sum()
+    y = sim.y[cell.alive]
+    assert np.all((y > -length) & (y < length))
+    assert np.all((sim.x >= 0.0) & (sim.x < width))
+    # Инжекция занимает свободные места: массивы уплотняются редко
+    assert cell.compactions < 4000 // 20
+
+    steady = sum(a[1500:].mean() for a in cell.absorbed.values())
+    assert abs(steady - 5.0) < 0.5
+
+    flux, gradient, d_eff, permeability = PhysicsAnalyzer.calculate_permeation(
+        cell, "top"
+    )
+    assert gradient < 0
+    assert abs(d_eff - 0.25) < 0.03
+    assert np.isclose(permeability, d_eff / (length - 0.5), rtol=0.1)
+
+    try:
+        sim.keep_history = True
+        sim.run()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("history with a varying particle count must fail")
+
+    # Ячейка без wrap_x: ширина для нормировки потока обязательна
+    sim = SimulationEngine(num_trajectories=0, num_steps=300, geometry_type="empty")
+    sim.keep_history = False
+    cell = sim.add_observer(
+        PermeationCell(
+            [RadialSink(6.0)], [PointSource(2.0)], profile=("x", -6.0, 6.0, 12)
+        )
+    )
+    sim.run()
+    assert cell.compactions < 30
+    with pytest.raises(ValueError):
+        PhysicsAnalyzer.calculate_permeation(cell, "r>=6")
+    flux, *_ = PhysicsAnalyzer.calculate_permeation(cell, "r>=6", width=12.0)
+    assert flux > 0
+
+
+def test_adaptive_multistep_matches_fixed():
+    """
+    Адаптивное объединение шагов вдали от стен: D_eff совпадает с
+    обычным движком в пределах статистической ошибки, снимки синхронны,
+    а число розыгрышей смещений заметно меньше.
+    """
+    results = []
+    for miss in (None, 1e-3):
+        sim = SimulationEngine(
+            num_trajectories=10000, num_steps=1500, barrier_dist=20.0, hole_size=8.0
+        )
+        sim.history_step = 50
+        sim.seed = 5
+        sim.adaptive_miss = miss
+        sim.run()
+        slopes = PhysicsAnalyzer.calculate_particle_slopes(sim)
+        results.append((slopes.mean(), slopes.std() / np.sqrt(len(slopes))))
+        assert len(sim.history_x) == 1500 // 50 + 1
+
+    (fixed, fixed_err), (adaptive, adaptive_err) = results
+    assert abs(adaptive - fixed) < 4 * np.hypot(fixed_err, adaptive_err)
+    assert sim.adaptive_draws < 0.6 * 10000 * 1500
+
+    # Без стен каждая частица проходит интервал между снимками за один розыгрыш
+    sim = SimulationEngine(num_trajectories=100, num_steps=300, geometry_type="empty")
+    sim.history_step = 100
+    sim.adaptive_miss = 1e-3
+    sim.run()
+    assert sim.adaptive_draws == 100 * 3
+
+
+def test_job_queue_retries_and_persists(tmp_path):
+    """
+    Очередь в SQLite: задания выполняются работником, упавшие повторяются
+    до max_attempts, задания умершего работника возвращаются в очередь,
+    а результаты видны после переоткрытия файла.
+    """
+    path = str(tmp_path / "jobs.sqlite")
+    config = {
+        "num_trajectories": 300,
+        "num_steps": 100,
+        "geometry_type": "parallel",
+        "history_step": 10,
+        "seed": 1,
+    }
+    with JobQueue(path) as queue:
+        # Работник умер, не сообщив результат: задание вернется в очередь
+        lost = queue.submit(config)
+        assert queue.claim("dead-worker")["id"] == lost
+
+        good = queue.submit(config, name="good")
+        bad = queue.submit({**config, "geometry_type": "bogus"}, max_attempts=2)
+        archived = queue.submit({**config, "save_archive": True})
+
+    worker = JobWorker(path, results_dir=str(tmp_path), name="test")
+    while worker.run_once():
+        pass
+    worker.queue.close()
+
+    with JobQueue(path) as queue:
+        assert queue.get(lost)["status"] == "running"
+        assert queue.requeue_stale(timeout=0.0) == [lost]
+        assert queue.get(lost)["status"] == QUEUED
+        assert queue.counts() == {DONE: 2, FAILED: 1, QUEUED: 1}
+
+        job = queue.get(good)
+        assert job["name"] == "good" and job["attempts"] == 1
+        assert job["runtime"] > 0 and job["result"]["d_eff"] > 0
+        assert job["result"]["r2"] > 0.5
+
+        job = queue.get(bad)
+        assert job["attempts"] == 2 and "Unknown geometry" in job["error"]
+
+        archive_path = queue.get(archived)["result"]["archive"]
+        with TrajectoryArchive(archive_path) as archive:
+            assert archive.final_positions()[0].shape == (300,)
+
+
+def test_job_memory_budget_reaches_planner(tmp_path, monkeypatch):
+    """
+    Бюджет памяти задания (или доля работника пула) передается планировщику,
+    а не заменяется всей доступной памятью машины.
+    """
+    import planner
+
+    budgets = []
+    original = planner.RunPlanner.plan
+
+    def plan(self, sim):
+        budgets.append((self.memory_budget, self.max_runtime))
+        return original(self, sim)
+
+    monkeypatch.setattr(planner.RunPlanner, "plan", plan)
+
+    path = str(tmp_path / "jobs.sqlite")
+    config = {"num_trajectories": 200, "num_steps": 50, "history_step": 10}
+    with JobQueue(path) as queue:
+        own = queue.submit({**config, "memory_budget": 2**30, "max_runtime": 60.0})
+        shared = queue.submit(config)
+        tiny = queue.submit({**config, "memory_budget": 1024}, max_attempts=1)
+
+    worker = JobWorker(path, str(tmp_path), name="test", memory_budget=2**29)
+    while worker.run_once():
+        pass
+    worker.queue.close()
+
+    assert budgets == [(2**30, 60.0), (2**29, None), (1024, None)]
+    with JobQueue(path) as queue:
+        assert queue.get(own)["status"] == DONE
+        assert queue.get(shared)["status"] == DONE
+        assert "not feasible" in queue.get(tiny)["error"]
+
+    pool = JobWorkerPool(path, num_workers=4)
+    total = planner.available_memory()
+    assert pool.worker_budget() == (None if total is None else total // 4)
+
+
+def test_job_ownership_and_heartbeat(tmp_path):
+    """
+    Heartbeat идет по таймеру, а не только в контрольных точках; работник,
+    чье задание уже отдано другому, не перезаписывает его результат.
+    """
+    from jobqueue import _Heartbeat
+
+    path = str(tmp_path / "jobs.sqlite")
+    with JobQueue(path) as queue:
+        job_id = queue.submit({"num_trajectories": 10, "num_steps": 10})
+        queue.claim("slow")
+        started = queue.get(job_id)["heartbeat"]
+
+        heartbeat = _Heartbeat(path, job_id, interval=0.02)
+        heartbeat.on_start(None)
+        time.sleep(0.2)
+        heartbeat.on_finish(None)
+        assert queue.get(job_id)["heartbeat"] > started
+
+        # "slow" признан упавшим, задание забрал "fast"
+        assert queue.requeue_stale(worker="slow") == [job_id]
+        assert queue.claim("fast")["id"] == job_id
+        assert not queue.complete(job_id, {"d_eff": 1.0}, worker="slow")
+        assert queue.fail(job_id, "late error", worker="slow") is None
+        job = queue.get(job_id)
+        assert job["status"] == "running" and job["worker"] == "fast"
+
+        assert queue.complete(job_id, {"d_eff": 2.0}, worker="fast")
+        assert queue.get(job_id)["result"] == {"d_eff": 2.0}
+
+
+def test_tracer_history_streams_msd(tmp_path):
+    """
+    Трассеры: история хранится только для подмножества частиц, а MSD и
+    D_eff по всему ансамблю совпадают с прогоном с полной историей.
+    """
+    runs = []
+    for tracers in (None, 40):
+        sim = SimulationEngine(num_trajectories=5000, num_steps=300, hole_size=3.0)
+        sim.history_step = 10
+        sim.seed = 2
+        sim.tracers = tracers
+        sim.run()
+        runs.append(sim)
+    full, traced = runs
+
+    assert np.array(traced.history_x).shape == (31, 40)
+    np.testing.assert_array_equal(traced.history_x[-1], full.history_x[-1][:40])
+
+    _, msd_full = PhysicsAnalyzer.calculate_msd(full)
+    _, msd_traced = PhysicsAnalyzer.calculate_msd(traced)
+    np.testing.assert_allclose(msd_traced, msd_full)
+    assert np.isclose(
+        PhysicsAnalyzer.calculate_diffusion_coefficient(traced)[0],
+        PhysicsAnalyzer.calculate_diffusion_coefficient(full)[0],
+    )
+    plt.close(SimulationPlotter.plot_trajectories(traced, num_trajectories=100))
+    plt.close(SimulationPlotter.plot_statistics(traced))
+
+    # Архив трассерного прогона сохраняет MSD всего ансамбля
+    path = str(tmp_path / "tracers.traj")
+    TrajectoryArchiveWriter.save_history(traced, path)
+    with TrajectoryArchive(path) as archive:
+        assert archive.num_particles == 40
+        restored = archive.to_sim()
+    np.testing.assert_allclose(restored.msd, msd_full)
+
+    # Потоковая запись задания очереди: в архив попадают только трассеры
+    config = {
+        "num_trajectories": 5000,
+        "num_steps": 200,
+        "history_step": 10,
+        "seed": 2,
+        "tracers": 10,
+        "save_archive": True,
+    }
+    result = run_job(config, str(tmp_path), job_id=1)
+    with TrajectoryArchive(result["archive"]) as archive:
+        assert archive.num_particles == 10
+        assert archive.to_sim().history_x.shape == (21, 10)
+        assert len(archive.meta["msd"]) == 21
+
+
+def test_packed_obstacles_porosity(tmp_path):
+    """
+    Непересекающиеся препятствия с заданной пористостью: воспроизводимы
+    по seed, не перекрываются, лежат в поле и сохраняются в файл.
+    """
+    geo = RandomObstaclesGeometry.packed(
+        0.6, obstacle_radius=2.0, field_size=60.0, seed=7
+    )
+    again = RandomObstaclesGeometry.packed(
+        0.6, obstacle_radius=2.0, field_size=60.0, seed=7
+    )
+    np.testing.assert_array_equal(geo.centers_x, again.centers_x)
+
+    assert abs(geo.porosity - 0.6) < 1e-3
+    dx = geo.centers_x[:, None] - geo.centers_x[None, :]
+    dy = geo.centers_y[:, None] - geo.centers_y[None, :]
+    dist = np.hypot(dx, dy) + np.eye(geo.num_obstacles) * 1e9
+    assert dist.min() >= 2 * geo.r_obs
+    assert np.all(np.abs(geo.centers_x) <= 60.0 - 2.0)
+    assert np.all(np.abs(geo.centers_y) <= 60.0 - 2.0)
+
+    path = str(tmp_path / "medium.npz")
+    geo.save(path)
+    sim = SimulationEngine(
+        num_trajectories=10, num_steps=10, geometry_type="random", obstacles_path=path
+    )
+    np.testing.assert_array_equal(sim.geo_strategy.centers_y, geo.centers_y)
+    assert sim.geo_strategy.r_obs == geo.r_obs
+
+    # Проверка конечной точки по сеточному индексу совпадает с
+    # последовательным проходом по всем препятствиям (и при перекрытиях)
+    np.random.seed(4)
+    overlapping = RandomObstaclesGeometry(400, obstacle_radius=5.0, field_size=60.0)
+    rng = np.random.default_rng(0)
+    for medium in (geo, overlapping):
+        x = rng.uniform(-70, 70, 3000)
+        y = rng.uniform(-70, 70, 3000)
+        ex, ey = x.copy(), y.copy()
+        for cx, cy in zip(medium.centers_x, medium.centers_y):
+            dist = np.hypot(ex - cx, ey - cy)
+            hit = dist < medium.r_obs
+            scale = (medium.r_obs + 0.01) / np.maximum(dist[hit], 0.001)
+            ex[hit] = cx + (ex[hit] - cx) * scale
+            ey[hit] = cy + (ey[hit] - cy) * scale
+        got_x, got_y = medium.apply_boundaries(x, y, x, y)
+        np.testing.assert_allclose(got_x, ex)
+        np.testing.assert_allclose(got_y, ey)
+
+    try:
+        RandomObstaclesGeometry.packed(0.3, obstacle_radius=2.0, field_size=60.0)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("porosity beyond the RSA limit must be rejected")
+
+
+def test_continuous_collisions():
+    """
+    Непрерывная проверка столкновений: зеркальное отражение в точке удара,
+    отсутствие туннелирования при шагах больше препятствия и бенчмарк
+    против проверки конечной точки.
+    """
+    geo = RandomObstaclesGeometry.packed(
+        0.6, obstacle_radius=2.0, field_size=40.0, seed=3
+    )
+    geo.collision = "continuous"
+
+    # Лобовой удар: от x = cx - 5 на 4 вперед, удар при x = cx - 2,
+    # остаток 1 отражается назад
+    cx, cy = geo.centers_x[0], geo.centers_y[0]
+    x, y = geo.apply_boundaries(
+        np.array([cx - 5.0]), np.array([cy]), np.array([cx - 1.0]), np.array([cy])
+    )
+    assert np.isclose(x[0], cx - 3.0) and np.isclose(y[0], cy)
+
+    # Шаги порядка диаметра: ни одна частица не оказывается внутри
+    rng = np.random.default_rng(0)
+    x = rng.uniform(-30, 30, 5000)
+    y = rng.uniform(-30, 30, 5000)
+    for _ in range(20):
+        dx, dy = rng.normal(0, 4.0, (2, len(x)))
+        x, y = geo.apply_boundaries(x, y, x + dx, y + dy)
+        dist = np.hypot(x[:, None] - geo.centers_x, y[:, None] - geo.centers_y)
+        assert dist.min() >= geo.r_obs * (1 - 1e-9)
+
+    bench = CollisionBenchmark(
+        geo, step_scales=(0.5, 2.0), num_trajectories=300, duration=4.0, seed=1
+    )
+    results = bench.run()
+    assert results[(2.0, "endpoint")]["tunnel_rate"] > 0.05
+    assert results[(2.0, "continuous")]["tunnel_rate"] == 0.0
+    assert "continuous" in bench.report()
+
+
+def test_streaming_diffusion_tensor():
+    """
+    Потоковые моменты совпадают с расчетом по истории; тензор диффузии
+    в параллельных линиях анизотропен (барьеры тормозят только y), а
+    подгонка для полетов Леви отклоняется по alpha_2.
+    """
+    sim = SimulationEngine(
+        num_trajectories=8000, num_steps=1500, barrier_dist=10.0, hole_size=3.0
+    )
+    sim.history_step = 50
+    sim.seed = 4
+    sim.run()
+
+    X, Y = np.array(sim.history_x), np.array(sim.history_y)
+    dx, dy = X - X[0], Y - Y[0]
+    moments = np.array(sim.moments)
+    np.testing.assert_allclose(moments[:, 1], np.sum(dx**2, axis=1))
+    np.testing.assert_allclose(moments[:, 3], np.sum(dx * dy, axis=1), atol=1e-6)
+    np.testing.assert_allclose(moments[:, 4], np.sum((dx**2 + dy**2) ** 2, axis=1))
+
+    tensor = PhysicsAnalyzer.calculate_diffusion_tensor(sim)
+    (dxx, dxy), (_, dyy) = tensor["tensor"]
+    assert abs(dxx - 0.25) < 0.02
+    assert dyy < 0.8 * dxx and abs(dxy) < 0.02
+    assert min(tensor["angle"], 180.0 - tensor["angle"]) < 10.0
+    assert tensor["diffusive"]
+    # След тензора согласован со скалярным наклоном MSD (slope = 2 * trace)
+    slope, _ = PhysicsAnalyzer.calculate_diffusion_coefficient(sim)
+    assert np.isclose(slope, 2 * np.trace(tensor["tensor"]))
+
+    levy = SimulationEngine(
+        num_trajectories=4000,
+        num_steps=200,
+        movement_type="levy",
+        geometry_type="empty",
+    )
+    levy.history_step = 10
+    levy.keep_history = False
+    levy.run()
+    assert not PhysicsAnalyzer.calculate_diffusion_tensor(levy)["diffusive"]
+
+
+def test_counter_rng_replay():
+    """
+    Счетный генератор: траектории выбранных частиц восстанавливаются
+    после прогона без истории, а блочный режим совпадает с пошаговым.
+    """
+    config = dict(
+        num_trajectories=3000,
+        num_steps=200,
+        movement_type="maxwell",
+        geometry_type="circle",
+        barrier_dist=10.0,
+        hole_size=3.0,
+    )
+    sim = SimulationEngine(**config)
+    sim.history_step = 10
+    sim.seed = 5
+    sim.counter_rng = True
+    sim.run()
+
+    pick = [0, 17, 1234, 2999]
+    hx, hy = sim.replay(pick)
+    np.testing.assert_array_equal(hx, np.array(sim.history_x)[:, pick])
+    np.testing.assert_array_equal(hy, np.array(sim.history_y)[:, pick])
+
+    # Новый движок с тем же ключом, без повторения всего прогона
+    fresh = SimulationEngine(**config)
+    fresh.seed = 5
+    fresh.counter_rng = True
+    np.testing.assert_array_equal(
+        fresh.replay(pick, history_step=200)[0][-1], sim.x[pick]
+    )
+
+    chunked = SimulationEngine(**config)
+    chunked.seed = 5
+    chunked.counter_rng = True
+    chunked.chunk_size = 700
+    chunked.num_threads = 2
+    chunked.run()
+    np.testing.assert_array_equal(chunked.x, sim.x)
+    np.testing.assert_array_equal(chunked.y, sim.y)
+
+
+def test_analytics_pipeline():
+    """
+    Конвейер аналитики: результаты анализаторов в фоновых потоках совпадают
+    с расчетом после прогона, очередь ограничена, ошибки не теряются.
+    """
+    seen = []
+
+    def max_radius(step, x, y):
+        time.sleep(0.01)  # медленный анализатор: срабатывает обратное давление
+        seen.append(step)
+        return float(np.max(np.hypot(x, y)))
+
+    sim = SimulationEngine(num_trajectories=4000, num_steps=300, hole_size=3.0)
+    sim.history_step = 10
+    sim.tracers = 20
+    pipeline = sim.add_observer(
+        AnalyticsPipeline(
+            [MSDAnalyzer(), RadialProfileAnalyzer(dr=4.0)], num_workers=2, max_pending=1
+        )
+    )
+    pipeline.register(max_radius)
+    sim.run()
+
+    steps, msd = pipeline.results["msd"]
+    np.testing.assert_array_equal(steps, np.arange(0, 301, 10))
+    np.testing.assert_allclose(msd, sim.msd)
+    _, profiles = pipeline.results["radial"]
+    expected = PhysicsAnalyzer.calculate_radial_concentration(sim, dr=4.0)
+    for got, want in zip(profiles[-1], expected):
+        np.testing.assert_array_equal(got, want)
+    _, radii = pipeline.results["max_radius"]
+    assert radii[-1] == np.max(np.hypot(sim.x, sim.y))
+    assert sorted(seen) == list(range(0, 301, 10))
+    assert pipeline.max_in_flight <= 1 + 2 + 1
+
+    # Только выбранные шаги: остальные снимки в очередь не попадают
+    sim = SimulationEngine(num_trajectories=500, num_steps=50)
+    sim.history_step = 10
+    pipeline = sim.add_observer(
+        AnalyticsPipeline([RadialProfileAnalyzer(dr=4.0, steps={50})])
+    )
+    sim.run()
+    steps, profiles = pipeline.results["radial"]
+    assert list(steps) == [50] and pipeline.max_in_flight == 1
+    np.testing.assert_array_equal(
+        profiles[0][2], PhysicsAnalyzer.calculate_radial_concentration(sim, 4.0)[2]
+    )
+
+    def broken(step, x, y):
+        raise ZeroDivisionError
+
+    sim = SimulationEngine(num_trajectories=100, num_steps=50)
+    sim.add_observer(AnalyticsPipeline([broken]))
+    with pytest.raises(RuntimeError):
+        sim.run()
+
+
+def test_simulation_import_is_headless():
+    """
+    Импорт ядра симуляции не тянет matplotlib и укладывается в бюджет
+    времени холодного старта (проверяется в чистом процессе).
+    """
+    budget = 1.0  # секунды
+    code = (
+        "import sys, time\n"
+        "t = time.perf_counter()\n"
+        "import simulation\n"
+        "print(time.perf_counter() - t, 'matplotlib' in sys.modules)\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+
+    assert out[1] == "False"
+    assert float(out[0]) < budget
+
+
 if __name__ == "__main__":
     run_test()
     # test_all_geometries()
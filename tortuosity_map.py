@@ -0,0 +1,201 @@
+import numpy as np
+from scipy.interpolate import griddata
+
+from analytics import PhysicsAnalyzer
+from simulation import SimulationEngine
+
+
+class _PointEstimate:
+    """
+    Накопленная оценка D_eff в одной точке параметров. Повторные прогоны
+    объединяются по вкладам отдельных частиц (формула Чана для дисперсии).
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.runs = 0
+
+    def add(self, slopes):
+        n_b = len(slopes)
+        mean_b = np.mean(slopes)
+        m2_b = np.sum((slopes - mean_b) ** 2)
+
+        delta = mean_b - self.mean
+        total = self.n + n_b
+        self.mean += delta * n_b / total
+        self.m2 += m2_b + delta**2 * self.n * n_b / total
+        self.n = total
+        self.runs += 1
+
+    @property
+    def tau(self):
+        return 1.0 / self.mean
+
+    @property
+    def tau_err(self):
+        se = np.sqrt(self.m2 / (self.n - 1) / self.n)
+        return se / self.mean**2
+
+
+class AdaptiveTortuosityMapper:
+    """
+    Адаптивная карта τ(barrier_dist, hole_size).
+
+    Начинает с грубой сетки и тратит новые прогоны там, где τ меняется
+    быстрее всего или доверительный интервал шире всего:
+    - ячейка с наибольшим приоритетом (разброс τ по углам + ширина ДИ)
+      делится на 4, если разброс больше шума;
+    - иначе повторно считается угол с самым широким ДИ.
+    Останавливается по бюджету budget (частице-шаги).
+    """
+
+    def __init__(
+        self,
+        geometry_type="parallel",
+        barrier_range=(10.0, 40.0),
+        hole_range=(2.0, 10.0),
+        coarse=3,
+        budget=5e8,
+        num_trajectories=1000,
+        num_steps=2000,
+        history_step=20,
+        max_depth=4,
+        z=1.96,
+        **kwargs,
+    ):
+        self.geometry_type = geometry_type
+        self.barrier_range = barrier_range
+        self.hole_range = hole_range
+        self.coarse = coarse
+        self.budget = budget
+        self.num_trajectories = num_trajectories
+        self.num_steps = num_steps
+        self.history_step = history_step
+        self.max_depth = max_depth
+        self.z = z
+        self.kwargs = kwargs
+
+        self.spent = 0
+        self.estimates = {}
+        # Ячейка: (b0, b1, h0, h1, глубина)
+        self.cells = []
+
+    @property
+    def run_cost(self):
+        return self.num_trajectories * self.num_steps
+
+    def _evaluate(self, point):
+        barrier_dist, hole_size = point
+        sim = SimulationEngine(
+            num_trajectories=self.num_trajectories,
+            num_steps=self.num_steps,
+            geometry_type=self.geometry_type,
+            barrier_dist=barrier_dist,
+            hole_size=hole_size,
+            **self.kwargs,
+        )
+        sim.history_step = self.history_step
+        sim.run()
+        self.spent += self.run_cost
+
+        estimate = self.estimates.setdefault(point, _PointEstimate())
+        estimate.add(PhysicsAnalyzer.calculate_particle_slopes(sim))
+
+    def _ensure(self, points):
+        """Считает отсутствующие точки; False, если не хватает бюджета."""
+        missing = [p for p in dict.fromkeys(points) if p not in self.estimates]
+        if self.spent + len(missing) * self.run_cost > self.budget:
+            return False
+        for p in missing:
+            self._evaluate(p)
+        return True
+
+    @staticmethod
+    def _corners(cell):
+        b0, b1, h0, h1, _ = cell
+        return [(b0, h0), (b1, h0), (b0, h1), (b1, h1)]
+
+    def _priority(self, cell):
+        est = [self.estimates[p] for p in self._corners(cell)]
+        taus = [e.tau for e in est]
+        spread = max(taus) - min(taus)
+        ci = max(self.z * e.tau_err for e in est)
+        return spread + ci, spread, ci
+
+    def _split(self, cell):
+        b0, b1, h0, h1, depth = cell
+        bm, hm = 0.5 * (b0 + b1), 0.5 * (h0 + h1)
+        new_points = [(bm, h0), (bm, h1), (b0, hm), (b1, hm), (bm, hm)]
+        if not self._ensure(new_points):
+            return False
+        self.cells.remove(cell)
+        self.cells += [
+            (b0, bm, h0, hm, depth + 1),
+            (bm, b1, h0, hm, depth + 1),
+            (b0, bm, hm, h1, depth + 1),
+            (bm, b1, hm, h1, depth + 1),
+        ]
+        return True
+
+    def run(self):
+        bs = np.linspace(*self.barrier_range, self.coarse)
+        hs = np.linspace(*self.hole_range, self.coarse)
+
+        grid = [(float(b), float(h)) for b in bs for h in hs]
+        if not self._ensure(grid):
+            raise ValueError("Budget is too small for the coarse grid")
+        self.cells = [
+            (float(bs[i]), float(bs[i + 1]), float(hs[j]), float(hs[j + 1]), 0)
+            for i in range(self.coarse - 1)
+            for j in range(self.coarse - 1)
+        ]
+
+        while self.spent + self.run_cost <= self.budget:
+            ranked = sorted(self.cells, key=lambda c: self._priority(c)[0])
+            progressed = False
+            for cell in reversed(ranked):
+                _, spread, ci = self._priority(cell)
+                if spread > ci and cell[4] < self.max_depth:
+                    progressed = self._split(cell)
+                else:
+                    # Шум доминирует: уточняем самый неточный угол
+                    worst = max(
+                        self._corners(cell), key=lambda p: self.estimates[p].tau_err
+                    )
+                    self._evaluate(worst)
+                    progressed = True
+                if progressed:
+                    break
+            if not progressed:
+                break
+
+        return self.result()
+
+    def result(self):
+        """
+        Точки выборки и оценки τ в них:
+        points (M, 2) = (barrier_dist, hole_size), tau, tau_err, runs.
+        """
+        points = list(self.estimates)
+        est = [self.estimates[p] for p in points]
+        return {
+            "points": np.array(points),
+            "tau": np.array([e.tau for e in est]),
+            "tau_err": np.array([e.tau_err for e in est]),
+            "runs": np.array([e.runs for e in est]),
+            "spent": self.spent,
+        }
+
+    def tau_map(self, nx=50, ny=50, method="linear"):
+        """
+        Интерполяция τ на регулярную сетку.
+        Возвращает (barrier_grid, hole_grid, tau_grid).
+        """
+        res = self.result()
+        bx, hy = np.meshgrid(
+            np.linspace(*self.barrier_range, nx), np.linspace(*self.hole_range, ny)
+        )
+        tau = griddata(res["points"], res["tau"], (bx, hy), method=method)
+        return bx, hy, tau